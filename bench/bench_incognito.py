@@ -0,0 +1,243 @@
+"""Headless benchmarks for the incognito plugin.
+
+Runs the plugin against the stand-in pwnagotchi view from ``fakes.py`` and
+replays synthetic hook streams, reporting per-hook latency percentiles, pet
+moves per second and memory use:
+
+    python bench/bench_incognito.py --elements 40 --duration 5 > bench_output.txt
+
+With ``--trace`` a hook trace recorded on a device (``trace_file`` option) is
+replayed on a virtual clock instead, reporting the CPU time it took:
+
+    python bench/bench_incognito.py --trace incognito.trace --option seed=1
+"""
+
+import argparse
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes  # noqa: E402
+
+fakes.install()
+
+import incognito  # noqa: E402
+
+
+class HookTimer(object):
+    """Collect per-hook call latencies"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def call(self, hook, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.samples.setdefault(hook, []).append(time.perf_counter() - start)
+        return result
+
+    def report(self):
+        lines = [
+            "%-24s %8s %9s %9s %9s %9s"
+            % ("hook", "calls", "p50 us", "p90 us", "p99 us", "max us")
+        ]
+        for hook, samples in sorted(self.samples.items()):
+            samples = sorted(samples)
+            lines.append(
+                "%-24s %8d %9.1f %9.1f %9.1f %9.1f"
+                % (
+                    hook,
+                    len(samples),
+                    percentile(samples, 50) * 1e6,
+                    percentile(samples, 90) * 1e6,
+                    percentile(samples, 99) * 1e6,
+                    samples[-1] * 1e6,
+                )
+            )
+        return "\n".join(lines)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return 0.0
+    index = max(0, min(len(samples) - 1, int(round(pct / 100.0 * len(samples))) - 1))
+    return samples[index]
+
+
+def make_plugin(view, options):
+    plugin = incognito.Incognito()
+    plugin.options = dict(options)
+    view.register(plugin)
+    plugin.on_loaded()
+    plugin.on_ui_setup(view)
+    return plugin
+
+
+def replay(plugin, view, timer, duration, ui_fps, log_rate, wifi_burst, wifi_period):
+    """Feed timed hook streams into the plugin for ``duration`` seconds"""
+    start = time.monotonic()
+    next_ui = next_log = next_wifi = start
+    log_interval = 1.0 / log_rate if log_rate > 0 else None
+    ui_interval = 1.0 / ui_fps if ui_fps > 0 else None
+    sequence = 0
+
+    while True:
+        now = time.monotonic()
+        if now - start >= duration:
+            break
+
+        if ui_interval is not None and now >= next_ui:
+            timer.call("view.update", view.update)
+            next_ui += ui_interval
+
+        if log_interval is not None:
+            while next_log <= now:
+                sequence += 1
+                timer.call(
+                    "on_log",
+                    plugin.on_log,
+                    None,
+                    "[INFO] synthetic entry %d" % sequence,
+                )
+                next_log += log_interval
+
+        if wifi_burst and now >= next_wifi:
+            for _ in range(wifi_burst):
+                timer.call("on_wifi_update", plugin.on_wifi_update, None, [])
+            next_wifi += wifi_period
+
+        timer.call("on_epoch", plugin.on_epoch, None, sequence, {})
+        time.sleep(0.0005)
+
+
+def microbench(plugin, view, timer, iterations):
+    """Time the internal paths directly, without any pacing"""
+    for _ in range(iterations):
+        timer.call("_move_pet(force)", plugin._move_pet, view, True)
+        timer.call("on_ui_update", plugin.on_ui_update, view)
+
+    for _ in range(max(1, iterations // 100)):
+        timer.call("_restore_normal_mode", plugin._restore_normal_mode, view)
+        timer.call("_apply_incognito_mode", plugin._apply_incognito_mode, view)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--elements", type=int, default=20, help="extra UI elements")
+    parser.add_argument("--width", type=int, default=250)
+    parser.add_argument("--height", type=int, default=122)
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds")
+    parser.add_argument("--ui-fps", type=float, default=10.0)
+    parser.add_argument("--log-rate", type=float, default=1000.0, help="on_log/s")
+    parser.add_argument("--wifi-burst", type=int, default=50)
+    parser.add_argument("--wifi-period", type=float, default=1.0)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--trace", help="replay a recorded hook trace instead")
+    parser.add_argument(
+        "--partial-refresh",
+        action="store_true",
+        help="push only the plugin's dirty rectangle to the counting display",
+    )
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="plugin option, may be repeated",
+    )
+    args = parser.parse_args(argv)
+
+    # keep benchmark runs from writing or reusing a saved state file
+    options = {"enabled": True, "state_file": ""}
+    for option in args.option:
+        key, _, value = option.partition("=")
+        try:
+            options[key] = float(value) if "." in value else int(value)
+        except ValueError:
+            options[key] = value
+
+    if not args.trace:
+        tracemalloc.start()
+    view = fakes.View(args.width, args.height, extra_elements=args.elements)
+    view.display = fakes.CountingDisplay(args.width, args.height)
+    view.partial_refresh = args.partial_refresh
+    plugin = make_plugin(view, options)
+
+    if args.trace:
+        replay_view = fakes.View(args.width, args.height, extra_elements=args.elements)
+        result = plugin.replay_trace(args.trace, replay_view)
+        print(
+            "replayed %d events covering %.1fs in %.3fs wall, %.3fs CPU"
+            % (
+                result["events"],
+                result["trace_seconds"],
+                result["wall_seconds"],
+                result["cpu_seconds"],
+            )
+        )
+        print("final pet position: (%.2f, %.2f)" % result["pet_position"])
+        return
+
+    timer = HookTimer()
+    writes_before = plugin.get_pet_info()["position_writes"]
+    replay(
+        plugin,
+        view,
+        timer,
+        args.duration,
+        args.ui_fps,
+        args.log_rate,
+        args.wifi_burst,
+        args.wifi_period,
+    )
+    info = plugin.get_pet_info()
+    moves = info["position_writes"] - writes_before
+    microbench(plugin, view, timer, args.iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        "elements=%d screen=%dx%d duration=%.1fs ui_fps=%.0f log_rate=%.0f/s "
+        "wifi_burst=%d/%.1fs"
+        % (
+            len(view._state._state),
+            args.width,
+            args.height,
+            args.duration,
+            args.ui_fps,
+            args.log_rate,
+            args.wifi_burst,
+            args.wifi_period,
+        )
+    )
+    print(timer.report())
+    print("moves/s: %.2f" % (moves / args.duration))
+    print("draw calls: %d" % view.draw_calls)
+    print("hook events: %s" % info["hook_events"])
+    print("face sprites: %s" % info["sprites"])
+    display = view.display
+    print(
+        "display: %d pushes (%d partial), %d bytes vs %d for full refreshes (%.1f%%)"
+        % (
+            display.pushes,
+            display.partial_pushes,
+            display.bytes_pushed,
+            display.full_bytes,
+            100.0 * display.bytes_pushed / max(1, display.full_bytes),
+        )
+    )
+    print("python peak traced memory: %.1f KiB" % (peak / 1024.0))
+    print(
+        "max RSS: %.1f MiB"
+        % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    )
+
+
+if __name__ == "__main__":
+    main()
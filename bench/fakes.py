@@ -0,0 +1,376 @@
+"""Stand-in pwnagotchi modules for running the incognito plugin off-device.
+
+``install()`` registers minimal ``pwnagotchi.plugins``, ``pwnagotchi.ui.*`` and
+``pwnagotchi.utils`` modules in ``sys.modules`` so that ``incognito.py`` can be
+imported on a plain Linux box, and ``View`` mimics the parts of
+``pwnagotchi.ui.view.View`` the plugin touches: ``_state._state``, the view
+lock, the screen size and a draw loop over ``_state.items()``.
+"""
+
+import sys
+import threading
+import types
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = ImageDraw = ImageFont = None
+
+BLACK = 0x00
+WHITE = 0xFF
+
+DEFAULT_ELEMENTS = [
+    "channel",
+    "aps",
+    "uptime",
+    "line1",
+    "line2",
+    "friend_face",
+    "friend_name",
+    "name",
+    "status",
+    "shakes",
+    "mode",
+]
+
+
+class FakeFont(object):
+    """Fixed-pitch font used when PIL is not installed"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def getbbox(self, text):
+        return (0, 0, len(text) * (self.size // 2 + 1), self.size)
+
+
+def _load_font(size):
+    if ImageFont is None:
+        return FakeFont(size)
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+class Widget(object):
+    def __init__(self, xy, color=BLACK):
+        self.xy = xy
+        self.color = color
+
+    def draw(self, canvas, drawer):
+        raise NotImplementedError()
+
+
+class Text(Widget):
+    def __init__(
+        self,
+        value="",
+        position=(0, 0),
+        font=None,
+        color=BLACK,
+        wrap=False,
+        max_length=0,
+    ):
+        super(Text, self).__init__(position, color)
+        self.value = value
+        self.font = font
+        self.wrap = wrap
+        self.max_length = max_length
+
+    def draw(self, canvas, drawer):
+        if self.value is not None:
+            drawer.text(self.xy, self.value, font=self.font, fill=self.color)
+
+
+class LabeledValue(Widget):
+    def __init__(
+        self,
+        label,
+        value="",
+        position=(0, 0),
+        label_font=None,
+        text_font=None,
+        color=BLACK,
+        label_spacing=5,
+    ):
+        super(LabeledValue, self).__init__(position, color)
+        self.label = label
+        self.value = value
+        self.label_font = label_font
+        self.text_font = text_font
+        self.label_spacing = label_spacing
+
+    def draw(self, canvas, drawer):
+        if self.label is None:
+            drawer.text(self.xy, self.value, font=self.label_font, fill=self.color)
+        else:
+            pos = self.xy
+            drawer.text(pos, self.label, font=self.label_font, fill=self.color)
+            drawer.text(
+                (pos[0] + self.label_spacing + 5 * len(self.label), pos[1]),
+                self.value,
+                font=self.text_font,
+                fill=self.color,
+            )
+
+
+class Line(Widget):
+    def __init__(self, xy, color=BLACK, width=1):
+        super(Line, self).__init__(xy, color)
+        self.width = width
+
+    def draw(self, canvas, drawer):
+        drawer.line(self.xy, fill=self.color, width=self.width)
+
+
+class CountingDrawer(object):
+    """ImageDraw stand-in that only counts calls, used without PIL"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def text(self, *args, **kwargs):
+        self.calls += 1
+
+    def line(self, *args, **kwargs):
+        self.calls += 1
+
+
+class State(object):
+    """Copy of the parts of pwnagotchi.ui.state.State the view and plugin use"""
+
+    def __init__(self, state=None):
+        self._state = state if state is not None else {}
+        self._lock = threading.Lock()
+        self._listeners = {}
+        self._changes = {}
+
+    def add_element(self, key, elem):
+        self._state[key] = elem
+        self._changes[key] = True
+
+    def has_element(self, key):
+        return key in self._state
+
+    def remove_element(self, key):
+        del self._state[key]
+        self._changes[key] = True
+
+    def items(self):
+        with self._lock:
+            return self._state.items()
+
+    def get(self, key):
+        with self._lock:
+            return self._state[key].value if key in self._state else None
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._state:
+                prev = self._state[key].value
+                self._state[key].value = value
+                if prev != value:
+                    self._changes[key] = True
+
+    def reset(self):
+        with self._lock:
+            self._changes = {}
+
+
+class View(object):
+    """Stand-in for pwnagotchi.ui.view.View with ``extra_elements`` plugin elements"""
+
+    def __init__(self, width=250, height=122, extra_elements=0, options=None):
+        self._width = width
+        self._height = height
+        self._config = {"ui": {"display": {"width": width, "height": height}}}
+        self._lock = threading.Lock()
+        self._plugins = []
+        self.options = options or {}
+        self.draw_calls = 0
+        self.display = None
+        self.partial_refresh = False
+
+        fonts = sys.modules.get("pwnagotchi.ui.fonts")
+        small = getattr(fonts, "Small", None)
+        state = {}
+        for index, name in enumerate(DEFAULT_ELEMENTS[:8]):
+            state[name] = LabeledValue(
+                name.upper(),
+                "0",
+                position=(index * 20, 0),
+                label_font=small,
+                text_font=small,
+            )
+        state["face"] = Text(
+            value="(◕‿‿◕)", position=(0, 40), font=getattr(fonts, "Huge", None)
+        )
+        for name in DEFAULT_ELEMENTS[8:]:
+            state[name] = Text(value=name, position=(125, 20), font=small)
+        for index in range(extra_elements):
+            state["plugin_%d" % index] = LabeledValue(
+                "P%d" % index,
+                "value",
+                position=(index % width, index % height),
+                label_font=small,
+                text_font=small,
+            )
+        self._state = State(state)
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def set(self, key, value):
+        self._state.set(key, value)
+
+    def register(self, plugin):
+        """Route on_ui_update to ``plugin`` the way plugins.on('ui_update') would"""
+        self._plugins.append(plugin)
+
+    def update(self):
+        """Run one frame: the ui_update hook, then draw every element from _state.items().
+
+        With a ``display`` attached, a frame in which something changed is
+        pushed to it: only the plugin's dirty rectangle when
+        ``partial_refresh`` is set and no state value changed, else the full
+        screen.
+        """
+        with self._lock:
+            if Image is not None:
+                canvas = Image.new("1", (self._width, self._height), WHITE)
+                drawer = ImageDraw.Draw(canvas)
+            else:
+                canvas, drawer = None, CountingDrawer()
+
+            for plugin in self._plugins:
+                plugin.on_ui_update(self)
+
+            for _, element in self._state.items():
+                element.draw(canvas, drawer)
+                self.draw_calls += 1
+
+            if self.display is not None:
+                rect = self.__dict__.pop("incognito_dirty_rect", None)
+                changed = bool(self._state._changes)
+                if rect is not None or changed:
+                    self.display.push(
+                        rect if self.partial_refresh and not changed else None
+                    )
+
+            self._state.reset()
+            return canvas
+
+
+class CountingDisplay(object):
+    """Display driver stand-in that counts the bytes a 1-bit panel would be sent.
+
+    A full refresh sends every row; a partial refresh sends the rows of the
+    given (x0, y0, x1, y1) window, widened to whole bytes on the x axis the
+    way e-ink controllers address their RAM.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pushes = 0
+        self.partial_pushes = 0
+        self.bytes_pushed = 0
+        self.full_bytes = 0
+
+    def frame_bytes(self, rect=None):
+        if rect is None:
+            rect = (0, 0, self.width, self.height)
+        x0, y0, x1, y1 = rect
+        x0 = x0 // 8 * 8
+        x1 = min(-(-self.width // 8) * 8, -(-x1 // 8) * 8)
+        return (x1 - x0) // 8 * max(0, y1 - y0)
+
+    def push(self, rect=None):
+        """Send one frame, the whole screen when ``rect`` is None"""
+        self.pushes += 1
+        if rect is not None:
+            self.partial_pushes += 1
+        self.bytes_pushed += self.frame_bytes(rect)
+        self.full_bytes += self.frame_bytes()
+
+
+def install():
+    """Register the stand-in pwnagotchi modules, returns the fake fonts module"""
+    if "pwnagotchi" in sys.modules and not getattr(
+        sys.modules["pwnagotchi"], "__incognito_fake__", False
+    ):
+        raise RuntimeError("a real pwnagotchi package is already imported")
+
+    pwnagotchi = types.ModuleType("pwnagotchi")
+    pwnagotchi.__incognito_fake__ = True
+    pwnagotchi.__path__ = []
+
+    plugins = types.ModuleType("pwnagotchi.plugins")
+
+    class Plugin(object):
+        options = {}
+
+    plugins.Plugin = Plugin
+
+    ui = types.ModuleType("pwnagotchi.ui")
+    ui.__path__ = []
+
+    components = types.ModuleType("pwnagotchi.ui.components")
+    for cls in (Widget, Text, LabeledValue, Line):
+        setattr(components, cls.__name__, cls)
+
+    view = types.ModuleType("pwnagotchi.ui.view")
+    view.BLACK = BLACK
+    view.WHITE = WHITE
+    view.View = View
+
+    state = types.ModuleType("pwnagotchi.ui.state")
+    state.State = State
+
+    fonts = types.ModuleType("pwnagotchi.ui.fonts")
+    for name, size in (
+        ("Small", 9),
+        ("BoldSmall", 9),
+        ("Medium", 12),
+        ("Bold", 12),
+        ("BoldBig", 20),
+        ("Huge", 25),
+    ):
+        setattr(fonts, name, _load_font(size))
+
+    utils = types.ModuleType("pwnagotchi.utils")
+
+    pwnagotchi.plugins = plugins
+    pwnagotchi.ui = ui
+    pwnagotchi.utils = utils
+    ui.components = components
+    ui.view = view
+    ui.state = state
+    ui.fonts = fonts
+
+    sys.modules.update(
+        {
+            "pwnagotchi": pwnagotchi,
+            "pwnagotchi.plugins": plugins,
+            "pwnagotchi.utils": utils,
+            "pwnagotchi.ui": ui,
+            "pwnagotchi.ui.components": components,
+            "pwnagotchi.ui.view": view,
+            "pwnagotchi.ui.state": state,
+            "pwnagotchi.ui.fonts": fonts,
+        }
+    )
+
+    if ImageFont is None and "PIL" not in sys.modules:
+        pil = types.ModuleType("PIL")
+        pil.__path__ = []
+        image_font = types.ModuleType("PIL.ImageFont")
+        image_font.load_default = lambda *args: FakeFont(10)
+        pil.ImageFont = image_font
+        sys.modules.update({"PIL": pil, "PIL.ImageFont": image_font})
+
+    return fonts
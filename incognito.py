@@ -1,14 +1,1754 @@
+import time
+
+# taken before any other import, so the import time covers them too
+_import_started = time.perf_counter()
+
 import logging
+import math
 import os
-import time
 import json
-
+import random
+import struct
+import threading
+from array import array
+from collections import deque, namedtuple
+from functools import lru_cache, wraps
+
+# pwnagotchi.ui.fonts is imported by _setup_pet_face, once incognito mode is used
 import pwnagotchi.plugins as plugins
-from pwnagotchi.ui.components import *
-from pwnagotchi.ui.view import BLACK
-from PIL import ImageFont
-import pwnagotchi.ui.fonts as fonts
-import pwnagotchi.utils as utils
+
+DisplayProfile = namedtuple(
+    "DisplayProfile", ["name", "frame_rate", "max_refreshes_per_minute", "step"]
+)
+DisplayProfile.__doc__ = """How often and how far the pet may move on a display.
+
+frame_rate is the target number of pet position updates per second,
+max_refreshes_per_minute caps position updates over a sliding minute and step
+is the smallest movement in pixels (per axis) worth a refresh. E-ink panels
+refresh slowly, so the pet moves there in larger, rarer jumps.
+"""
+
+DISPLAY_PROFILES = {
+    (250, 122): DisplayProfile('Waveshare 2.13"', 2.0, 60, 3),
+    (212, 104): DisplayProfile('Waveshare 2.13" v2', 2.0, 60, 3),
+    (296, 128): DisplayProfile('Waveshare 2.9"', 2.0, 60, 3),
+    (400, 300): DisplayProfile('Waveshare 4.2"', 1.0, 30, 4),
+    (128, 64): DisplayProfile("OLED 128x64", 30.0, 1800, 1),
+    (128, 32): DisplayProfile("OLED 128x32", 30.0, 1800, 1),
+}
+
+DEFAULT_DISPLAY_PROFILE = DisplayProfile("Unknown", 20.0, 1200, 1)
+
+# Attribute set on the view with the (x0, y0, x1, y1) screen area the plugin
+# changed since the display last cleared it (by setting it to None); display
+# code that supports partial refresh only needs to push that area
+DIRTY_RECT_ATTR = "incognito_dirty_rect"
+
+
+class _FramePacer(object):
+    """Enforce a display profile's frame rate and per-minute refresh budget"""
+
+    def __init__(self, profile=DEFAULT_DISPLAY_PROFILE):
+        self._profile = profile
+        self._frame_interval = 0.0
+        self._last_frame = float("-inf")
+        self._recent = deque()
+        self.deferred = 0
+        self.configure(profile)
+
+    def configure(self, profile):
+        """Switch to another display profile"""
+        self._profile = profile
+        self._frame_interval = (
+            1.0 / profile.frame_rate if profile.frame_rate > 0 else 0.0
+        )
+
+    def ready(self, now, slowdown=1.0):
+        """Check if a new frame may be shown at ``now``, ``slowdown`` times less often"""
+        if now - self._last_frame < self._frame_interval * slowdown:
+            self.deferred += 1
+            return False
+
+        recent = self._recent
+        while recent and now - recent[0] >= 60.0:
+            recent.popleft()
+        if len(recent) >= self._profile.max_refreshes_per_minute:
+            self.deferred += 1
+            return False
+        return True
+
+    def mark(self, now):
+        """Record that a frame was shown at ``now``.
+
+        Frames shown less than an interval late are booked at their due time, so
+        hook jitter does not push every later frame back and lose some of them.
+        """
+        due = self._last_frame + self._frame_interval
+        self._last_frame = due if due <= now < due + self._frame_interval else now
+        self._recent.append(now)
+
+    def refreshes_last_minute(self, now):
+        """Count the frames shown over the last 60 seconds"""
+        return sum(1 for shown in self._recent if now - shown < 60.0)
+
+
+class _IdleGovernor(object):
+    """Slow the pet down, then park it, while nobody is around.
+
+    Activity (peers, handshakes, webhook requests) is reported with wake().
+    After ``slow_after`` seconds without any the pet moves ``slowdown`` times
+    less often, and after ``park_after`` seconds it is parked: no steps and no
+    position writes until the next wake(). A delay of 0 or less turns that
+    stage off.
+    """
+
+    ACTIVE = "active"
+    SLOW = "slow"
+    PARKED = "parked"
+
+    def __init__(self, slow_after=600.0, park_after=1800.0, slowdown=4.0):
+        self.slow_after = slow_after
+        self.park_after = park_after
+        self.slowdown = slowdown
+        self._last_activity = None
+
+    def configure(self, slow_after=None, park_after=None, slowdown=None):
+        """Change the delays and the slow-stage slowdown, None keeps the current value"""
+        if slow_after is not None:
+            self.slow_after = float(slow_after)
+        if park_after is not None:
+            self.park_after = float(park_after)
+        if slowdown is not None:
+            self.slowdown = max(1.0, float(slowdown))
+
+    def wake(self, now):
+        """Record activity at ``now``, return the state the pet was in before"""
+        previous = self.state(now)
+        self._last_activity = now
+        return previous
+
+    def idle_time(self, now):
+        """Seconds since the last activity"""
+        if self._last_activity is None:
+            self._last_activity = now
+        return now - self._last_activity
+
+    def state(self, now):
+        """Return ACTIVE, SLOW or PARKED for ``now``"""
+        idle = self.idle_time(now)
+        if 0 < self.park_after <= idle:
+            return self.PARKED
+        if 0 < self.slow_after <= idle:
+            return self.SLOW
+        return self.ACTIVE
+
+
+class _PluginLog(object):
+    """Plugin logger with level-gated lazy formatting and per-key rate limiting.
+
+    ``limited()`` lets at most ``burst`` messages per key through every
+    ``interval`` seconds and reports how many were suppressed when the next
+    window opens, so per-frame diagnostics cannot flood the SD card.
+    """
+
+    def __init__(self, logger, interval=60.0, burst=5):
+        self.logger = logger
+        self.name = logger.name
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def addFilter(self, log_filter):
+        self.logger.addFilter(log_filter)
+
+    def removeFilter(self, log_filter):
+        self.logger.removeFilter(log_filter)
+
+    def log(self, level, msg, *args):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg, *args, stacklevel=2)
+
+    def debug(self, msg, *args):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.log(logging.DEBUG, msg, *args, stacklevel=2)
+
+    def info(self, msg, *args):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.log(logging.INFO, msg, *args, stacklevel=2)
+
+    def warning(self, msg, *args):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self.logger.log(logging.WARNING, msg, *args, stacklevel=2)
+
+    def error(self, msg, *args):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self.logger.log(logging.ERROR, msg, *args, stacklevel=2)
+
+    def limited(self, key, level, msg, *args):
+        """Log ``msg`` unless messages with the same key exceeded their budget"""
+        if not self.logger.isEnabledFor(level):
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return
+
+        if suppressed:
+            self.logger.log(
+                level,
+                "%d '%s' messages suppressed in the last %ds",
+                suppressed,
+                key,
+                self.interval,
+                stacklevel=2,
+            )
+        self.logger.log(level, msg, *args, stacklevel=2)
+
+    def flush(self):
+        """Report messages still suppressed in the open windows"""
+        with self._lock:
+            windows, self._windows = self._windows, {}
+        for key, (_, _, suppressed) in windows.items():
+            if suppressed:
+                self.logger.info("%d '%s' messages suppressed", suppressed, key)
+
+
+TRACE_MAGIC = b"INCT"
+TRACE_VERSION = 1
+TRACE_HOOKS = {
+    "on_ui_update": 1,
+    "on_epoch": 2,
+    "on_peer_detected": 3,
+    "on_handshake": 4,
+    "on_log": 5,
+    "on_wifi_update": 6,
+}
+
+# header: magic, version, wall clock time of the first event
+_TRACE_HEADER = struct.Struct("<4sBd")
+# event: microseconds since the previous event, hook id (0 = time gap only)
+_TRACE_EVENT = struct.Struct("<IB")
+_TRACE_MAX_DELTA = 0xFFFFFFFF
+
+
+class _TraceRecorder(object):
+    """Write timestamped hook events to a compact binary trace file.
+
+    Each event takes five bytes; events are buffered and written in blocks.
+    """
+
+    def __init__(self, path, clock, flush_size=4096):
+        self.path = path
+        self._clock = clock
+        self._flush_size = flush_size
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._file = open(path, "wb")
+        self._file.write(_TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, time.time()))
+        self._last = clock()
+        self.events = 0
+
+    def record(self, hook_id):
+        """Append one event for ``hook_id`` at the current clock time"""
+        now = self._clock()
+        with self._lock:
+            if self._file is None:
+                return
+            delta = int((now - self._last) * 1000000)
+            self._last += delta / 1000000.0
+            buffer = self._buffer
+            while delta > _TRACE_MAX_DELTA:
+                buffer += _TRACE_EVENT.pack(_TRACE_MAX_DELTA, 0)
+                delta -= _TRACE_MAX_DELTA
+            buffer += _TRACE_EVENT.pack(max(0, delta), hook_id)
+            self.events += 1
+            if len(buffer) >= self._flush_size:
+                self._flush()
+
+    def _flush(self):
+        self._file.write(self._buffer)
+        self._file.flush()
+        del self._buffer[:]
+
+    def close(self):
+        """Write out buffered events and close the file"""
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+
+
+def read_trace(path):
+    """Yield (seconds since the first event, hook name) pairs from a trace file"""
+    names = {hook_id: name for name, hook_id in TRACE_HOOKS.items()}
+    with open(path, "rb") as trace:
+        header = trace.read(_TRACE_HEADER.size)
+        if len(header) < _TRACE_HEADER.size:
+            raise ValueError("%s is not an incognito trace" % path)
+        magic, version, _ = _TRACE_HEADER.unpack(header)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError("%s is not an incognito trace" % path)
+
+        data = trace.read()
+
+    elapsed = 0
+    usable = len(data) - len(data) % _TRACE_EVENT.size
+    for delta, hook_id in _TRACE_EVENT.iter_unpack(data[:usable]):
+        elapsed += delta
+        if hook_id:
+            yield elapsed / 1000000.0, names.get(hook_id)
+
+
+class _VirtualClock(object):
+    """Clock that only moves when told to, used to replay traces"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class _TraceReplayer(object):
+    """Feed a recorded trace into a plugin on a virtual clock, as fast as possible"""
+
+    def __init__(self, plugin, ui):
+        self._plugin = plugin
+        self._ui = ui
+
+    def _call(self, hook):
+        plugin, ui = self._plugin, self._ui
+        if hook == "on_ui_update":
+            plugin.on_ui_update(ui)
+        elif hook == "on_epoch":
+            plugin.on_epoch(None, 0, {})
+        elif hook == "on_peer_detected":
+            plugin.on_peer_detected(None, None)
+        elif hook == "on_handshake":
+            plugin.on_handshake(None, None, None, None)
+        elif hook == "on_log":
+            plugin.on_log(None, None)
+        elif hook == "on_wifi_update":
+            plugin.on_wifi_update(None, [])
+
+    def run(self, path):
+        """Replay the trace at ``path``, returning event count and timings"""
+        plugin = self._plugin
+        clock = _VirtualClock(plugin._clock())
+        start = clock.now
+        previous_clock, recorder = plugin._clock, plugin._recorder
+
+        plugin._set_clock(clock)
+        plugin._recorder = None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        events = 0
+        offset = 0.0
+        try:
+            for offset, hook in read_trace(path):
+                clock.now = start + offset
+                self._call(hook)
+                events += 1
+        finally:
+            plugin._set_clock(previous_clock)
+            plugin._recorder = recorder
+
+        return {
+            "events": events,
+            "trace_seconds": offset,
+            "wall_seconds": time.perf_counter() - wall_start,
+            "cpu_seconds": time.process_time() - cpu_start,
+        }
+
+
+class _HookStats(object):
+    """Per-hook call counts, cumulative and maximum time, and recent durations.
+
+    Recent durations go to a fixed-size ring buffer per hook, so the memory
+    used does not grow with uptime.
+    """
+
+    def __init__(self, window=64):
+        self._window = window
+        self._lock = threading.Lock()
+        self._hooks = {}
+
+    def record(self, name, duration):
+        """Record one call of ``name`` that took ``duration`` seconds"""
+        with self._lock:
+            entry = self._hooks.get(name)
+            if entry is None:
+                entry = self._hooks[name] = [
+                    0,
+                    0.0,
+                    0.0,
+                    array("d", bytes(8 * self._window)),
+                ]
+            calls = entry[0]
+            entry[0] = calls + 1
+            entry[1] += duration
+            if duration > entry[2]:
+                entry[2] = duration
+            entry[3][calls % self._window] = duration
+
+    def snapshot(self):
+        """Return the statistics as a JSON-friendly dict, times in milliseconds"""
+        with self._lock:
+            hooks = {
+                name: (calls, total, longest, recent[: min(calls, self._window)])
+                for name, (calls, total, longest, recent) in self._hooks.items()
+            }
+
+        return {
+            name: {
+                "calls": calls,
+                "total_ms": round(total * 1000.0, 3),
+                "max_ms": round(longest * 1000.0, 3),
+                "recent_avg_ms": round(sum(recent) * 1000.0 / len(recent), 3),
+                "recent_max_ms": round(max(recent) * 1000.0, 3),
+            }
+            for name, (calls, total, longest, recent) in hooks.items()
+        }
+
+
+def _timed(func):
+    """Record the duration of every call of a plugin method in self._stats.
+
+    Calls of pwnagotchi hooks are also appended to the event trace when one is
+    being recorded.
+    """
+    name = func.__name__
+    trace_id = TRACE_HOOKS.get(name)
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if trace_id is not None and self._recorder is not None:
+            self._recorder.record(trace_id)
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self._stats.record(name, time.perf_counter() - start)
+
+    return wrapper
+
+
+class _HookDispatcher(object):
+    """Decide which hook events are allowed to move the pet.
+
+    Log entries emitted by the plugin itself are recognized and ignored, events
+    of the same hook arriving within ``merge_window`` seconds are merged into
+    one, and the hooks share a token bucket capped at ``max_moves_per_second``.
+    The dispatcher also acts as a logging filter on the plugin logger so that it
+    can recognize our own messages when they come back as plain strings.
+    """
+
+    def __init__(
+        self, logger_name, max_moves_per_second=5.0, merge_window=0.05, clock=None
+    ):
+        self._logger_name = logger_name
+        self.clock = clock or time.monotonic
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._recent_messages = deque(maxlen=32)
+        self._last_dispatch = {}
+        self._max_moves_per_second = 5.0
+        self._merge_window = 0.05
+        self._tokens = 0.0
+        self._last_refill = self.clock()
+        self._counters = {"dispatched": 0, "self": 0, "merged": 0, "dropped": 0}
+        self.configure(max_moves_per_second, merge_window)
+        self._tokens = self._max_moves_per_second
+
+    def configure(self, max_moves_per_second=None, merge_window=None):
+        """Update the rate cap and merge window"""
+        with self._lock:
+            if max_moves_per_second is not None:
+                self._max_moves_per_second = max(0.0, float(max_moves_per_second))
+            if merge_window is not None:
+                self._merge_window = max(0.0, float(merge_window))
+            self._tokens = min(self._tokens, self._max_moves_per_second)
+
+    def filter(self, record):
+        """logging.Filter hook - remember what the plugin logged, never block"""
+        try:
+            self._recent_messages.append(record.getMessage())
+        except Exception:
+            pass
+        return True
+
+    def is_own_entry(self, entry):
+        """Check if a log entry was produced by this plugin"""
+        if getattr(self._local, "busy", False):
+            return True
+
+        name = getattr(entry, "name", None)
+        if name is None and isinstance(entry, dict):
+            name = entry.get("name")
+        if name is not None:
+            return name == self._logger_name
+
+        text = entry.get("message") if isinstance(entry, dict) else entry
+        if not isinstance(text, str):
+            text = getattr(entry, "msg", None)
+        if not isinstance(text, str):
+            return False
+        return any(message in text for message in tuple(self._recent_messages))
+
+    def admit(self, hook, entry=None):
+        """Return True if an event from ``hook`` should move the pet now"""
+        if entry is not None and self.is_own_entry(entry):
+            with self._lock:
+                self._counters["self"] += 1
+            return False
+
+        now = self.clock()
+        with self._lock:
+            if now - self._last_dispatch.get(hook, float("-inf")) < self._merge_window:
+                self._counters["merged"] += 1
+                return False
+
+            self._tokens = min(
+                self._max_moves_per_second,
+                self._tokens + (now - self._last_refill) * self._max_moves_per_second,
+            )
+            self._last_refill = now
+            if self._tokens < 1.0:
+                self._counters["dropped"] += 1
+                return False
+
+            self._tokens -= 1.0
+            self._last_dispatch[hook] = now
+            self._counters["dispatched"] += 1
+            return True
+
+    def busy(self):
+        """Context manager marking the current thread as moving the pet"""
+        return _BusyFlag(self._local)
+
+    def stats(self):
+        """Return a copy of the dispatch counters"""
+        with self._lock:
+            return dict(self._counters)
+
+
+class _BusyFlag(object):
+    """Thread-local reentrancy flag used by _HookDispatcher.busy()"""
+
+    def __init__(self, local):
+        self._local = local
+
+    def __enter__(self):
+        self._local.busy = True
+        return self
+
+    def __exit__(self, *exc):
+        self._local.busy = False
+        return False
+
+
+@lru_cache(maxsize=128)
+def _measure_text(font, text):
+    """Return the (left, top, right, bottom) box of ``text`` drawn at (0, 0) with ``font``"""
+    if hasattr(font, "getbbox"):
+        return tuple(font.getbbox(text))
+    width, height = font.getsize(text)
+    return (0, 0, width, height)
+
+
+SAVED_PROPERTIES = (
+    "color",
+    "font",
+    "text_font",
+    "label_font",
+    "alt_font",
+    "label",
+    "size",
+    "width",
+    "height",
+    "scale",
+    "font_size",
+)
+
+# component class -> the SAVED_PROPERTIES its instances have
+_saved_properties_by_class = {}
+
+
+class ElementSnapshot(object):
+    """Saved xy and properties of one UI element, restored when leaving incognito mode.
+
+    Only the SAVED_PROPERTIES the element's class actually has are stored; the
+    tuple of names is shared by every snapshot of the same class.
+    """
+
+    __slots__ = ("xy", "names", "values")
+
+    def __init__(self, xy, names, values):
+        self.xy = xy
+        self.names = names
+        self.values = values
+
+    @classmethod
+    def capture(cls, element):
+        """Take a snapshot of ``element``"""
+        element_class = type(element)
+        names = _saved_properties_by_class.get(element_class)
+        if names is None:
+            names = tuple(prop for prop in SAVED_PROPERTIES if hasattr(element, prop))
+            _saved_properties_by_class[element_class] = names
+        return cls(
+            getattr(element, "xy", None),
+            names,
+            tuple(getattr(element, prop, None) for prop in names),
+        )
+
+    def restore(self, element):
+        """Put the saved xy and properties back on ``element``"""
+        if self.xy is not None:
+            element.xy = self.xy
+        for prop, value in zip(self.names, self.values):
+            setattr(element, prop, value)
+
+    def position(self):
+        """Return the saved position as {"xy": xy}, empty if the element had none"""
+        return {"xy": self.xy} if self.xy is not None else {}
+
+    def properties(self):
+        """Return the saved properties as a dict"""
+        return dict(zip(self.names, self.values))
+
+
+STATE_VERSION = 1
+
+
+def _jsonable(value):
+    """Return ``value`` as plain JSON data, or None if it cannot be (fonts, images)"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (tuple, list)):
+        items = [_jsonable(item) for item in value]
+        if all(item is not None for item in items):
+            return items
+    return None
+
+
+class _StateStore(object):
+    """Small JSON file with what the plugin learned about the UI, kept across restarts.
+
+    Writes go to a temporary file which is then renamed over the old one, so
+    a crash never leaves a half-written file. Unchanged data is not written
+    again, and changed data at most once every ``min_interval`` seconds
+    unless the save is forced.
+    """
+
+    def __init__(self, path, min_interval=60.0, clock=None):
+        self.path = path
+        self.min_interval = min_interval
+        self._clock = clock or time.monotonic
+        self._last_write = None
+        self._last_data = None
+        self.writes = 0
+
+    def load(self):
+        """Return the saved data, or None if there is no usable file"""
+        try:
+            with open(self.path, "r") as state_file:
+                data = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != STATE_VERSION:
+            return None
+        self._last_data = json.dumps(data, sort_keys=True)
+        return data
+
+    def save(self, data, force=False):
+        """Write ``data`` if it changed and the interval allows it, return True if written"""
+        encoded = json.dumps(data, sort_keys=True)
+        if encoded == self._last_data:
+            return False
+
+        now = self._clock()
+        if (
+            not force
+            and self._last_write is not None
+            and now - self._last_write < self.min_interval
+        ):
+            return False
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as state_file:
+            state_file.write(encoded)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(temp_path, self.path)
+
+        self._last_write = now
+        self._last_data = encoded
+        self.writes += 1
+        return True
+
+
+def _state_signature(state):
+    """Cheap marker of a state dict's key set: its size and last inserted key.
+
+    Elements are only ever appended to the view state, so a new element
+    always changes one of the two.
+    """
+    if not state:
+        return (0, None)
+    return (len(state), next(reversed(state.keys())))
+
+
+class _FaceResolver(object):
+    """Score UI elements as face candidates and cache the winner.
+
+    The result is cached on the set of element names, so the state is only
+    scored again when elements are added or removed. Ties go to the element
+    that was added to the state first.
+    """
+
+    FACE_CANDIDATES = [
+        "face",
+        "Face",
+        "FACE",
+        "status",
+        "Status",
+        "STATUS",
+        "mood",
+        "Mood",
+        "MOOD",
+        "emoji",
+        "Emoji",
+        "EMOJI",
+        "expression",
+        "Expression",
+    ]
+    FACE_KEYWORDS = ["face", "status", "mood", "emoji", "expression", "smile"]
+
+    EXACT_SCORE = 1000
+    KEYWORD_SCORE = 100
+    TEXT_SCORE = 10
+    DRAWABLE_SCORE = 1
+
+    def __init__(self):
+        self._key = None
+        self.choice = None
+        self.scores = {}
+        # names that may never be the face
+        self.excluded = frozenset()
+
+    def invalidate(self):
+        """Forget the cached result"""
+        self._key = None
+
+    def is_cached(self, state):
+        """Check if the cached result is still valid for ``state``"""
+        return self._key is not None and self._key == frozenset(state)
+
+    def prime(self, state, choice):
+        """Cache ``choice`` as the face for ``state`` without scoring the other elements"""
+        score, reason = self.score(choice, state[choice])
+        self._key = frozenset(state)
+        self.choice = choice
+        self.scores = {choice: (score, "saved state, " + str(reason))}
+
+    def resolve(self, state):
+        """Return the best face element name for ``state``, or None"""
+        key = frozenset(state)
+        if key == self._key:
+            return self.choice
+
+        scores = {}
+        excluded = self.excluded
+        for element_name, element in state.items():
+            if element_name in excluded:
+                continue
+            score, reason = self.score(element_name, element)
+            if score:
+                scores[element_name] = (score, reason)
+
+        best = None
+        for element_name, (score, _) in scores.items():
+            if best is None or score > scores[best][0]:
+                best = element_name
+
+        self._key = key
+        self.choice = best
+        self.scores = scores
+        return best
+
+    def score(self, element_name, element):
+        """Score one element, returning (score, reason)"""
+        if element_name in self.FACE_CANDIDATES:
+            rank = self.FACE_CANDIDATES.index(element_name)
+            return self.EXACT_SCORE - rank, "exact match"
+
+        element_name_lower = element_name.lower()
+        if any(keyword in element_name_lower for keyword in self.FACE_KEYWORDS):
+            return self.KEYWORD_SCORE, "keyword match"
+
+        if hasattr(element, "draw"):
+            if hasattr(element, "value") or hasattr(element, "text"):
+                return self.TEXT_SCORE, "drawable"
+            return self.DRAWABLE_SCORE, "fallback"
+
+        return 0, None
+
+
+class _ViewLock(object):
+    """Hold the view's lock, when it has one, for the duration of a with block.
+
+    The view draws with its lock held, so changes made inside the block never
+    show up half-done. If the lock cannot be taken within ``timeout`` (for
+    example because we are already inside the view's update) the block runs
+    without it.
+    """
+
+    def __init__(self, ui, timeout=0.5):
+        self._lock = getattr(ui, "_lock", None)
+        self._timeout = timeout
+        self.held = False
+
+    def __enter__(self):
+        if self._lock is not None and hasattr(self._lock, "acquire"):
+            self.held = self._lock.acquire(timeout=self._timeout)
+        return self
+
+    def __exit__(self, *exc):
+        if self.held:
+            self._lock.release()
+        return False
+
+
+class _RenderFilter(object):
+    """Stand-in for ``State.items`` that leaves hidden elements out of rendering.
+
+    The view draws whatever ``ui._state.items()`` returns, so installing an
+    instance of this class over that method keeps hidden elements from being
+    laid out and drawn at all, while ``ui._state._state`` stays untouched for
+    the plugins (tweak_view included) that read it directly.
+    """
+
+    def __init__(self, state, hidden):
+        self._state = state
+        self._hidden = hidden
+
+    def __call__(self):
+        hidden = self._hidden
+        return [
+            (name, element)
+            for name, element in self._state._state.items()
+            if name not in hidden
+        ]
+
+    def install(self):
+        """Put the filter in place of the state's items() method"""
+        self._state.items = self
+
+    def remove(self):
+        """Give the state its own items() method back"""
+        if self._state.__dict__.get("items") is self:
+            del self._state.items
+
+
+@lru_cache(maxsize=64)
+def _render_sprite(text, font):
+    """Rasterize ``text`` once into a 1-bit mask, returns ((left, top), mask)"""
+    from PIL import Image, ImageDraw
+
+    left, top, right, bottom = _measure_text(font, text)
+    mask = Image.new("1", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+    return (left, top), mask
+
+
+class _SpriteDraw(object):
+    """Stand-in for the face element's ``draw`` that pastes a cached sprite.
+
+    Each (face text, font) pair is laid out and rasterized once by
+    _render_sprite; every frame after that is a single masked paste at the
+    element's xy. Anything a sprite cannot reproduce (image faces, wrapped or
+    multi-line text, canvases that are not PIL images) goes to the element's
+    own draw.
+    """
+
+    def __init__(self, element):
+        self.element = element
+        self._draw = element.draw
+        self.pasted = 0
+        self.fallbacks = 0
+
+    def __call__(self, canvas, drawer):
+        element = self.element
+        text = element.value
+        font = getattr(element, "font", None)
+        if (
+            not isinstance(text, str)
+            or font is None
+            or "\n" in text
+            or getattr(element, "png", False)
+            or getattr(element, "wrap", False)
+            or not hasattr(canvas, "paste")
+        ):
+            self.fallbacks += 1
+            return self._draw(canvas, drawer)
+
+        (left, top), mask = _render_sprite(text, font)
+        x, y = element.xy
+        canvas.paste(element.color, (int(x) + left, int(y) + top), mask)
+        self.pasted += 1
+
+    def install(self):
+        """Put the sprite path in place of the element's draw() method"""
+        self.element.draw = self
+
+    def remove(self):
+        """Give the element its own draw() method back"""
+        if self.element.__dict__.get("draw") is self:
+            del self.element.draw
+
+
+PetState = namedtuple(
+    "PetState",
+    [
+        "x",
+        "y",
+        "velocity_x",
+        "velocity_y",
+        "direction_x",
+        "direction_y",
+        "bounds",
+        "time",
+    ],
+)
+PetState.__doc__ = """Immutable snapshot of the pet, swapped as a whole by _PetPhysics.
+
+bounds is the (min_x, min_y, max_x, max_y) area the pet's xy may roam in and
+time is the physics clock time of the last step.
+"""
+
+
+class _SpatialGrid(object):
+    """Uniform grid of obstacle boxes for constant time point queries.
+
+    Boxes are (x0, y0, x1, y1) areas the pet's xy must stay out of, i.e. the
+    visible elements already grown by the pet's own size.
+    """
+
+    def __init__(self, boxes, cell_size=16):
+        self.boxes = list(boxes)
+        self.cell_size = cell_size
+        self._cells = {}
+        for box in self.boxes:
+            x0, y0, x1, y1 = box
+            for cell_x in range(int(x0) // cell_size, int(x1) // cell_size + 1):
+                for cell_y in range(int(y0) // cell_size, int(y1) // cell_size + 1):
+                    self._cells.setdefault((cell_x, cell_y), []).append(box)
+
+    def hit(self, x, y):
+        """Return the box containing (x, y), or None"""
+        size = self.cell_size
+        boxes = self._cells.get((int(x) // size, int(y) // size))
+        if boxes:
+            for box in boxes:
+                if box[0] <= x <= box[2] and box[1] <= y <= box[3]:
+                    return box
+        return None
+
+
+def _reflect(box, x, y, previous_x, previous_y):
+    """Tell which axes to reflect on when moving from previous into ``box``.
+
+    Returns (flip_x, flip_y), or None when the move does not enter the box,
+    including when it already started inside it.
+    """
+    x0, y0, x1, y1 = box
+    outside_x = not (x0 <= previous_x <= x1)
+    outside_y = not (y0 <= previous_y <= y1)
+    if not (outside_x or outside_y):
+        return None
+    return outside_x, outside_y
+
+
+def _push_out(box, x, y, bounds):
+    """Move (x, y) from inside ``box`` to just past its nearest edge, within ``bounds``.
+
+    Used when the pet is already inside an obstacle (for example after the
+    obstacles were rebuilt around it), where _reflect has nothing to undo.
+    Returns the new point, or None if every way out leaves the bounds.
+    """
+    x0, y0, x1, y1 = box
+    min_x, min_y, max_x, max_y = bounds
+    exits = sorted(
+        (
+            (x - x0, x0 - 1, y),
+            (x1 - x, x1 + 1, y),
+            (y - y0, x, y0 - 1),
+            (y1 - y, x, y1 + 1),
+        )
+    )
+    for _, new_x, new_y in exits:
+        if min_x <= new_x <= max_x and min_y <= new_y <= max_y:
+            return new_x, new_y
+    return None
+
+
+class _MotionPattern(object):
+    """Base class for pet motion patterns.
+
+    A pattern writes the pet's next ``count`` positions as (x, y) pairs into an
+    ``array('h')`` in one go. Patterns are registered in MOTION_PATTERNS by name.
+    Free-moving patterns reflect off the boxes in ``obstacles`` (a _SpatialGrid);
+    the fixed-path ones (lissajous, patrol) ignore them.
+    """
+
+    name = None
+    avoids_obstacles = True
+
+    def __init__(self, rng, logger):
+        self.rng = rng
+        self._logger = logger
+        self.x = 0.0
+        self.y = 0.0
+
+    def move_to(self, x, y):
+        """Continue the pattern from (x, y)"""
+        self.x = float(x)
+        self.y = float(y)
+
+    def fill(self, out, count, bounds, obstacles=None):
+        """Write the next ``count`` positions into ``out``, return how many were written"""
+        raise NotImplementedError()
+
+
+# fixed-point positions and velocities: 1/256 pixel units
+FIXED_SHIFT = 8
+FIXED_ONE = 1 << FIXED_SHIFT
+
+# _JitterTable event flags
+_JITTER = 1
+_TURN = 2
+_TURN_RIGHT = 4
+_TURN_DOWN = 8
+
+
+class _JitterTable(object):
+    """Random draws for the bounce pattern, generated once per table seed.
+
+    Slot ``i`` holds the event of one step (none, a velocity jitter, a
+    direction change or both) together with the jitter and the new velocities
+    it uses, all in fixed-point units. The bounce pattern walks through the
+    slots with a cursor, so a step costs a table lookup instead of several
+    random draws, and the same seed always gives the same motion.
+    """
+
+    SIZE = 2048
+
+    def __init__(self, seed):
+        rng = random.Random(seed)
+        size = self.SIZE
+        self.events = bytearray(size)
+        self.jitter = array("h", bytes(2 * size))
+        self.velocity_x = array("h", bytes(2 * size))
+        self.velocity_y = array("h", bytes(2 * size))
+
+        for index in range(size):
+            event = 0
+            if rng.random() < 0.03:
+                event |= _JITTER
+            if rng.random() < 0.01:
+                event |= _TURN
+                if rng.random() < 0.5:
+                    event |= _TURN_RIGHT
+                if rng.random() < 0.5:
+                    event |= _TURN_DOWN
+            self.events[index] = event
+            self.jitter[index] = int(rng.uniform(-0.2, 0.2) * FIXED_ONE)
+            self.velocity_x[index] = int(rng.uniform(0.8, 2.0) * FIXED_ONE)
+            self.velocity_y[index] = int(rng.uniform(0.5, 1.5) * FIXED_ONE)
+
+
+@lru_cache(maxsize=4)
+def _jitter_table(seed):
+    """Return the shared _JitterTable for ``seed``"""
+    return _JitterTable(seed)
+
+
+class _BouncePattern(_MotionPattern):
+    """Bounce off the borders with random velocity jitter and direction changes.
+
+    Position and velocity are integers in 1/256 pixel units (FIXED_ONE). Random
+    draws come from one of four shared _JitterTables, picked by the pet's RNG.
+    """
+
+    name = "bounce"
+
+    MIN_VELOCITY_X = int(0.5 * FIXED_ONE)
+    MAX_VELOCITY_X = int(2.5 * FIXED_ONE)
+    MIN_VELOCITY_Y = int(0.3 * FIXED_ONE)
+    MAX_VELOCITY_Y = int(2.0 * FIXED_ONE)
+
+    def __init__(self, rng, logger):
+        super(_BouncePattern, self).__init__(rng, logger)
+        self.table_seed = rng.getrandbits(2)
+        self.table = None
+        self.step = rng.randrange(_JitterTable.SIZE)
+        self.draw = rng.randrange(_JitterTable.SIZE)
+        # taken from the table's starting slot on the first fill()
+        self.velocity_x = self.velocity_y = None
+        self.direction_x = rng.choice([-1, 1])
+        self.direction_y = rng.choice([-1, 1])
+        self.fixed_x = self.fixed_y = 0
+
+    def move_to(self, x, y):
+        super(_BouncePattern, self).move_to(x, y)
+        self.fixed_x = int(x * FIXED_ONE)
+        self.fixed_y = int(y * FIXED_ONE)
+
+    def fill(self, out, count, bounds, obstacles=None):
+        table = self.table
+        if table is None:
+            table = self.table = _jitter_table(self.table_seed)
+            self.velocity_x = table.velocity_x[self.draw]
+            self.velocity_y = table.velocity_y[self.draw]
+        events, jitter = table.events, table.jitter
+        table_x, table_y = table.velocity_x, table.velocity_y
+        mask = _JitterTable.SIZE - 1
+        limited = self._logger.limited
+        min_x, min_y, max_x, max_y = (int(bound * FIXED_ONE) for bound in bounds)
+        x, y = self.fixed_x, self.fixed_y
+        velocity_x, velocity_y = self.velocity_x, self.velocity_y
+        direction_x, direction_y = self.direction_x, self.direction_y
+        step, draw = self.step, self.draw
+
+        for index in range(0, 2 * count, 2):
+            previous_x, previous_y = x, y
+            x += velocity_x * direction_x
+            y += velocity_y * direction_y
+
+            if x <= min_x:
+                x = min_x
+                direction_x = 1
+                draw = (draw + 1) & mask
+                velocity_x = table_x[draw]
+                limited(
+                    "bounce", logging.DEBUG, "Pet hit left boundary, bouncing right"
+                )
+
+            elif x >= max_x:
+                x = max_x
+                direction_x = -1
+                draw = (draw + 1) & mask
+                velocity_x = table_x[draw]
+                limited(
+                    "bounce", logging.DEBUG, "Pet hit right boundary, bouncing left"
+                )
+
+            if y <= min_y:
+                y = min_y
+                direction_y = 1
+                draw = (draw + 1) & mask
+                velocity_y = table_y[draw]
+                limited("bounce", logging.DEBUG, "Pet hit top boundary, bouncing down")
+
+            elif y >= max_y:
+                y = max_y
+                direction_y = -1
+                draw = (draw + 1) & mask
+                velocity_y = table_y[draw]
+                limited("bounce", logging.DEBUG, "Pet hit bottom boundary, bouncing up")
+
+            if obstacles is not None:
+                pixel_x, pixel_y = x >> FIXED_SHIFT, y >> FIXED_SHIFT
+                box = obstacles.hit(pixel_x, pixel_y)
+                flip = box and _reflect(
+                    box,
+                    pixel_x,
+                    pixel_y,
+                    previous_x >> FIXED_SHIFT,
+                    previous_y >> FIXED_SHIFT,
+                )
+                if flip:
+                    if flip[0]:
+                        direction_x = -direction_x
+                    if flip[1]:
+                        direction_y = -direction_y
+                    x, y = previous_x, previous_y
+                    limited("obstacle", logging.DEBUG, "Pet bounced off %s", box)
+                elif box:
+                    pushed = _push_out(box, pixel_x, pixel_y, bounds)
+                    if pushed is not None:
+                        # boxes of elements with float xy give float points
+                        x = int(pushed[0]) << FIXED_SHIFT
+                        y = int(pushed[1]) << FIXED_SHIFT
+                        limited("obstacle", logging.DEBUG, "Pet pushed out of %s", box)
+
+            out[index] = x >> FIXED_SHIFT
+            out[index + 1] = y >> FIXED_SHIFT
+
+            step = (step + 1) & mask
+            event = events[step]
+            if not event:
+                continue
+
+            if event & _JITTER:
+                velocity_change = jitter[step]
+                velocity_x = max(
+                    self.MIN_VELOCITY_X,
+                    min(self.MAX_VELOCITY_X, velocity_x + velocity_change),
+                )
+                velocity_y = max(
+                    self.MIN_VELOCITY_Y,
+                    min(self.MAX_VELOCITY_Y, velocity_y + velocity_change),
+                )
+                limited(
+                    "jitter",
+                    logging.DEBUG,
+                    "Pet velocity adjusted for organic movement: (%.2f,%.2f)",
+                    velocity_x / FIXED_ONE,
+                    velocity_y / FIXED_ONE,
+                )
+
+            if event & _TURN:
+                direction_x = 1 if event & _TURN_RIGHT else -1
+                direction_y = 1 if event & _TURN_DOWN else -1
+                velocity_x, velocity_y = table_x[step], table_y[step]
+                limited(
+                    "direction",
+                    logging.DEBUG,
+                    "Pet randomly changed direction: dir=(%d,%d), vel=(%.2f,%.2f)",
+                    direction_x,
+                    direction_y,
+                    velocity_x / FIXED_ONE,
+                    velocity_y / FIXED_ONE,
+                )
+
+        self.fixed_x, self.fixed_y = x, y
+        self.x, self.y = x / FIXED_ONE, y / FIXED_ONE
+        self.velocity_x, self.velocity_y = velocity_x, velocity_y
+        self.direction_x, self.direction_y = direction_x, direction_y
+        self.step, self.draw = step, draw
+        return count
+
+
+class _LissajousPattern(_MotionPattern):
+    """Trace a 3:2 Lissajous curve filling the movement area.
+
+    The curve is fixed by the bounds, so move_to() only affects the next batch
+    through the bounds, not the phase.
+    """
+
+    name = "lissajous"
+    avoids_obstacles = False
+
+    def __init__(self, rng, logger):
+        super(_LissajousPattern, self).__init__(rng, logger)
+        self.phase = rng.uniform(0.0, 2.0 * math.pi)
+        self.angular_step = 0.015
+
+    def fill(self, out, count, bounds, obstacles=None):
+        min_x, min_y, max_x, max_y = bounds
+        center_x, center_y = (min_x + max_x) / 2.0, (min_y + max_y) / 2.0
+        radius_x, radius_y = (max_x - min_x) / 2.0, (max_y - min_y) / 2.0
+        phase, angular_step = self.phase, self.angular_step
+        sin = math.sin
+
+        for index in range(count):
+            phase += angular_step
+            out[2 * index] = int(center_x + radius_x * sin(3.0 * phase + math.pi / 2))
+            out[2 * index + 1] = int(center_y + radius_y * sin(2.0 * phase))
+
+        self.phase = phase % (2.0 * math.pi)
+        self.x, self.y = float(out[2 * count - 2]), float(out[2 * count - 1])
+        return count
+
+
+class _WanderPattern(_MotionPattern):
+    """Drift with a slowly turning heading, reflecting off the borders"""
+
+    name = "wander"
+
+    def __init__(self, rng, logger):
+        super(_WanderPattern, self).__init__(rng, logger)
+        self.heading = rng.uniform(0.0, 2.0 * math.pi)
+        self.speed = 1.2
+
+    def fill(self, out, count, bounds, obstacles=None):
+        rng = self.rng
+        min_x, min_y, max_x, max_y = bounds
+        x, y, heading, speed = self.x, self.y, self.heading, self.speed
+
+        for index in range(count):
+            previous_x, previous_y = x, y
+            heading += rng.uniform(-0.25, 0.25)
+            x += speed * math.cos(heading)
+            y += speed * math.sin(heading)
+
+            if x <= min_x or x >= max_x:
+                x = max(min_x, min(x, max_x))
+                heading = math.pi - heading
+            if y <= min_y or y >= max_y:
+                y = max(min_y, min(y, max_y))
+                heading = -heading
+
+            if obstacles is not None:
+                pixel_x, pixel_y = int(x), int(y)
+                box = obstacles.hit(pixel_x, pixel_y)
+                flip = box and _reflect(
+                    box, pixel_x, pixel_y, int(previous_x), int(previous_y)
+                )
+                if flip:
+                    if flip[0]:
+                        heading = math.pi - heading
+                    if flip[1]:
+                        heading = -heading
+                    x, y = previous_x, previous_y
+                elif box:
+                    pushed = _push_out(box, pixel_x, pixel_y, bounds)
+                    if pushed is not None:
+                        x, y = pushed
+
+            out[2 * index] = int(x)
+            out[2 * index + 1] = int(y)
+
+        self.x, self.y, self.heading = x, y, heading % (2.0 * math.pi)
+        return count
+
+
+class _PatrolPattern(_MotionPattern):
+    """Walk clockwise along the edges of the movement area"""
+
+    name = "patrol"
+    avoids_obstacles = False
+
+    def __init__(self, rng, logger):
+        super(_PatrolPattern, self).__init__(rng, logger)
+        self.corner = rng.randrange(4)
+        self.speed = 1.5
+
+    def fill(self, out, count, bounds, obstacles=None):
+        min_x, min_y, max_x, max_y = bounds
+        corners = ((min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y))
+        x, y, corner, speed = self.x, self.y, self.corner, self.speed
+
+        for index in range(count):
+            target_x, target_y = corners[corner]
+            distance = math.hypot(target_x - x, target_y - y)
+            if distance <= speed:
+                x, y = float(target_x), float(target_y)
+                corner = (corner + 1) % 4
+            else:
+                x += speed * (target_x - x) / distance
+                y += speed * (target_y - y) / distance
+
+            out[2 * index] = int(x)
+            out[2 * index + 1] = int(y)
+
+        self.x, self.y, self.corner = x, y, corner
+        return count
+
+
+MOTION_PATTERNS = {
+    pattern.name: pattern
+    for pattern in (_BouncePattern, _LissajousPattern, _WanderPattern, _PatrolPattern)
+}
+
+
+class _PetSwarm(object):
+    """Extra roaming elements, moved together with NumPy.
+
+    Positions, velocities and directions of all extra pets are (n, 2) arrays
+    and every tick bounces and jitters all of them in one vectorized step, so
+    the cost per tick barely grows with the number of pets. The pets follow
+    the same rules as the bounce pattern.
+    """
+
+    def __init__(self, np, names, seed=None):
+        count = len(names)
+        self.np = np
+        self.names = list(names)
+        self._rng = np.random.default_rng(seed)
+        self._velocity_min = np.array([0.8, 0.5])
+        self._velocity_max = np.array([2.0, 1.5])
+        self._jitter_min = np.array([0.5, 0.3])
+        self._jitter_max = np.array([2.5, 2.0])
+
+        self.low = np.zeros((count, 2))
+        self.high = np.zeros((count, 2))
+        self.position = np.zeros((count, 2))
+        self.velocity = self._random_velocity(count)
+        self.direction = self._rng.choice([-1.0, 1.0], size=(count, 2))
+        self._written = np.full((count, 2), np.iinfo(np.int32).min // 2, np.int32)
+
+    def _random_velocity(self, count):
+        return self._rng.uniform(self._velocity_min, self._velocity_max, (count, 2))
+
+    def set_bounds(self, bounds):
+        """Set the (min_x, min_y, max_x, max_y) bounds of every pet, in name order"""
+        np = self.np
+        bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+        self.low[:] = bounds[:, :2]
+        self.high[:] = np.maximum(bounds[:, 2:], bounds[:, :2])
+        np.clip(self.position, self.low, self.high, out=self.position)
+
+    def scatter(self):
+        """Put every pet at a random position inside its bounds"""
+        self.position[:] = self._rng.uniform(self.low, self.high)
+
+    def step(self, count):
+        """Advance every pet ``count`` ticks"""
+        np = self.np
+        rng = self._rng
+        position, velocity, direction = self.position, self.velocity, self.direction
+        low, high = self.low, self.high
+        pets = len(self.names)
+
+        for _ in range(count):
+            position += velocity * direction
+
+            hit_low = position <= low
+            hit_high = position >= high
+            hit = hit_low | hit_high
+            if hit.any():
+                np.clip(position, low, high, out=position)
+                direction[hit_low] = 1.0
+                direction[hit_high] = -1.0
+                velocity[hit] = self._random_velocity(pets)[hit]
+
+            jitter = rng.random(pets) < 0.03
+            if jitter.any():
+                change = rng.uniform(-0.2, 0.2, (pets, 1))
+                adjusted = np.clip(
+                    velocity + change, self._jitter_min, self._jitter_max
+                )
+                velocity[jitter] = adjusted[jitter]
+
+            turn = rng.random(pets) < 0.01
+            if turn.any():
+                direction[turn] = rng.choice([-1.0, 1.0], size=(pets, 2))[turn]
+                velocity[turn] = self._random_velocity(pets)[turn]
+
+    def write(self, state, step):
+        """Assign xy to the pets that moved at least ``step`` pixels, return how many"""
+        np = self.np
+        pixels = self.position.astype(np.int32)
+        moved = np.nonzero((np.abs(pixels - self._written) >= step).any(axis=1))[0]
+        names = self.names
+        for index in moved.tolist():
+            element = state.get(names[index])
+            if element is not None and hasattr(element, "xy"):
+                element.xy = (int(pixels[index, 0]), int(pixels[index, 1]))
+        self._written[moved] = pixels[moved]
+        return len(moved)
+
+    def positions(self):
+        """Return {name: (x, y)} for every pet"""
+        return {
+            name: (float(x), float(y))
+            for name, (x, y) in zip(self.names, self.position.tolist())
+        }
+
+
+class _PetPhysics(object):
+    """Fixed timestep movement engine for the roaming pet.
+
+    Elapsed ``clock()`` time is added to an accumulator which is drained in
+    whole ``timestep`` ticks, so the pet moves at the same speed no matter how
+    often (or how rarely) the pwnagotchi hooks ask for its position.
+
+    Positions come from a motion pattern, ``batch_size`` ticks at a time, into
+    an ``array('h')`` trajectory; each tick only reads the next entry. The
+    trajectory is recomputed when the bounds change or the pet is placed.
+
+    Randomness comes from a per-instance ``random.Random`` and time from an
+    injectable ``clock``, so a seeded engine fed the same timestamps always
+    moves the same way.
+
+    The pet lives in a single PetState snapshot. Writers are serialized by a
+    lock and publish a new snapshot with one attribute assignment, so readers
+    take ``physics.state`` without locking and never see a half-updated pet.
+    """
+
+    def __init__(
+        self,
+        logger,
+        timestep=0.05,
+        max_steps=10,
+        seed=None,
+        clock=None,
+        pattern="bounce",
+        batch_size=64,
+    ):
+        self._logger = logger
+        self._lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.clock = clock or time.monotonic
+        self.timestep = timestep
+        self.max_steps = max_steps
+        self.speed = 1.0
+
+        self.batch_size = batch_size
+        self._trajectory = array("h", bytes(4 * batch_size))
+        self._read = 0
+        self._filled = 0
+        self.pattern_name = pattern
+        self._pattern = MOTION_PATTERNS[pattern](self.rng, logger)
+        self.obstacles = None
+
+        self._accumulator = 0.0
+        self._last_time = self.clock()
+        self.state = PetState(50.0, 50.0, 1.5, 1.0, 1, 1, (15, 15, 235, 107), 0.0)
+        self._pattern.move_to(50.0, 50.0)
+
+    def reset(self, bounds, pattern=None):
+        """Center the pet in (min_x, min_y, max_x, max_y) bounds with a new random pattern"""
+        with self._lock:
+            if pattern is not None:
+                self.pattern_name = pattern
+            x = float((bounds[0] + bounds[2]) // 2)
+            y = float((bounds[1] + bounds[3]) // 2)
+            self._pattern = MOTION_PATTERNS[self.pattern_name](self.rng, self._logger)
+            self._pattern.move_to(x, y)
+            self._filled = self._read = 0
+            self._last_time = self.clock()
+            self._accumulator = 0.0
+            self.state = PetState(x, y, 0.0, 0.0, 1, 1, bounds, self._last_time)
+
+    def set_pattern(self, pattern):
+        """Switch to another motion pattern, continuing from the current position"""
+        with self._lock:
+            state = self.state
+            self.pattern_name = pattern
+            self._pattern = MOTION_PATTERNS[pattern](self.rng, self._logger)
+            self._pattern.move_to(state.x, state.y)
+            self._filled = self._read = 0
+
+    def set_obstacles(self, obstacles):
+        """Use a new _SpatialGrid of obstacles (or None) from the next tick on"""
+        with self._lock:
+            state = self.state
+            self.obstacles = obstacles
+            self._pattern.move_to(state.x, state.y)
+            self._filled = self._read = 0
+
+    def sync_clock(self, now=None):
+        """Drop accumulated time, e.g. after a pause, so the pet does not jump"""
+        with self._lock:
+            self._last_time = self.clock() if now is None else now
+            self._accumulator = 0.0
+
+    def set_bounds(self, bounds):
+        """Change the movement area, keeping the pet inside it"""
+        with self._lock:
+            state = self.state
+            self._replace_position(state._replace(bounds=bounds), state.x, state.y)
+
+    def place(self, x, y):
+        """Move the pet to (x, y), clamped to the movement area"""
+        with self._lock:
+            self._replace_position(self.state, float(x), float(y))
+
+    def _replace_position(self, state, x, y):
+        min_x, min_y, max_x, max_y = state.bounds
+        x, y = max(min_x, min(x, max_x)), max(min_y, min(y, max_y))
+        self._pattern.move_to(x, y)
+        self._filled = self._read = 0
+        self.state = state._replace(x=x, y=y)
+
+    def advance(self, now=None, extra_steps=0):
+        """Run every whole timestep that elapsed since the last call, return the count.
+
+        ``extra_steps`` are taken on top of the elapsed ones, regardless of the clock.
+        """
+        if now is None:
+            now = self.clock()
+
+        with self._lock:
+            self._accumulator += (now - self._last_time) * self.speed
+            self._last_time = now
+
+            steps = 0
+            if self._accumulator >= self.timestep:
+                steps = min(int(self._accumulator / self.timestep), self.max_steps)
+                if steps >= self.max_steps:
+                    self._accumulator = 0.0
+                else:
+                    self._accumulator -= steps * self.timestep
+
+            steps += extra_steps
+            if steps:
+                self.state = self._consume(self.state, steps)._replace(time=now)
+            return steps
+
+    def _consume(self, state, count):
+        """Return ``state`` moved ``count`` ticks along the trajectory"""
+        trajectory = self._trajectory
+        read, filled = self._read, self._filled
+        x, y = previous_x, previous_y = state.x, state.y
+
+        for _ in range(count):
+            if read >= filled:
+                filled = self._pattern.fill(
+                    trajectory, self.batch_size, state.bounds, self.obstacles
+                )
+                read = 0
+            previous_x, previous_y = x, y
+            x, y = trajectory[2 * read], trajectory[2 * read + 1]
+            read += 1
+
+        self._read, self._filled = read, filled
+        delta_x, delta_y = x - previous_x, y - previous_y
+        return PetState(
+            float(x),
+            float(y),
+            float(abs(delta_x)),
+            float(abs(delta_y)),
+            -1 if delta_x < 0 else 1,
+            -1 if delta_y < 0 else 1,
+            state.bounds,
+            state.time,
+        )
+
+
+def _option_bool(value):
+    """Parse a boolean option, accepting the usual strings"""
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "yes", "on", "1"):
+            return True
+        if lowered in ("false", "no", "off", "0", ""):
+            return False
+        raise ValueError(value)
+    return bool(value)
+
+
+def _option_names(value):
+    """Parse a list of element names, given as a list or a comma separated string"""
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(str(name).strip() for name in value if str(name).strip())
+
+
+def _option_number(cast, minimum):
+    """Return a parser for a number no smaller than ``minimum``"""
+
+    def parse(value):
+        if isinstance(value, bool):
+            raise ValueError(value)
+        return max(minimum, cast(value))
+
+    return parse
+
+
+def _option_per_display(cast, minimum):
+    """Return a parser for a number, or a dict of numbers keyed by display profile name"""
+    parse_number = _option_number(cast, minimum)
+
+    def parse(value):
+        if isinstance(value, dict):
+            return {str(name): parse_number(number) for name, number in value.items()}
+        return parse_number(value)
+
+    return parse
+
+
+def _option_choice(choices):
+    """Return a parser accepting only the names in ``choices``"""
+
+    def parse(value):
+        if value not in choices:
+            raise ValueError(value)
+        return value
+
+    return parse
+
+
+# (name, parser, default) of every option; a missing option takes the default
+OPTIONS = (
+    ("enabled", _option_bool, True),
+    ("speed", _option_number(float, 0.0), 1.0),
+    ("pattern", _option_choice(MOTION_PATTERNS), "bounce"),
+    ("timestep", _option_number(float, 0.001), 0.05),
+    ("seed", int, None),
+    ("pet_size", _option_number(int, 0), 15),
+    ("margin", _option_number(int, 0), 0),
+    ("frame_rate", _option_per_display(float, 0.0), None),
+    ("max_refreshes_per_minute", _option_per_display(int, 0), None),
+    ("min_pixel_delta", _option_per_display(int, 1), None),
+    ("max_hook_moves_per_second", _option_number(float, 0.0), 5.0),
+    ("hook_merge_window", _option_number(float, 0.0), 0.05),
+    ("hide_mode", _option_choice(("filter", "offscreen")), "filter"),
+    ("never_hide", _option_names, ()),
+    ("never_show", _option_names, ()),
+    ("extra_pets", _option_names, ()),
+    ("sprites", _option_bool, True),
+    ("idle_slow_after", _option_number(float, 0.0), 600.0),
+    ("idle_park_after", _option_number(float, 0.0), 1800.0),
+    ("idle_slowdown", _option_number(float, 1.0), 4.0),
+    ("state_file", str, "/root/.incognito-state.json"),
+    ("state_save_interval", _option_number(float, 0.0), 60.0),
+    ("trace_file", str, None),
+    ("config_file", str, "/etc/pwnagotchi/config.toml"),
+)
+
+
+def _plugin_section(config):
+    """Return this plugin's options from a full pwnagotchi config dict, or None"""
+    try:
+        section = config["main"]["plugins"]["incognito"]
+    except (KeyError, TypeError):
+        return None
+    return section if isinstance(section, dict) else None
+
+
+IncognitoConfig = namedtuple("IncognitoConfig", [option[0] for option in OPTIONS])
+IncognitoConfig.__doc__ = """Validated plugin options, one field per entry in OPTIONS.
+
+Element name lists are tuples; frame_rate, max_refreshes_per_minute and
+min_pixel_delta are None (use the display profile), a number or a dict keyed
+by display profile name.
+"""
+
+
+def parse_options(options, logger=None):
+    """Validate a plugin options dict into an IncognitoConfig.
+
+    Invalid values are replaced by their default and, like unknown options,
+    reported as warnings on ``logger``.
+    """
+    values = []
+    for name, parse, default in OPTIONS:
+        value = options.get(name)
+        if value is None:
+            values.append(default)
+            continue
+        try:
+            values.append(parse(value))
+        except (TypeError, ValueError):
+            if logger is not None:
+                logger.warning(
+                    "Invalid %s: %s, using %s", name, repr(value), repr(default)
+                )
+            values.append(default)
+
+    unknown = sorted(set(options) - set(IncognitoConfig._fields))
+    if unknown and logger is not None:
+        logger.warning("Unknown options: %s", ", ".join(unknown))
+    return IncognitoConfig(*values)
 
 
 class Incognito(plugins.Plugin):
@@ -18,101 +1758,147 @@ class Incognito(plugins.Plugin):
     __description__ = "Incognito mode - hides all UI elements except the face which becomes a roaming pet. Compatible with tweak_view.py, also any ui modifying plugins."
 
     def __init__(self):
+        init_started = time.perf_counter()
         self._agent = None
         self._start = time.time()
-        self._logger = logging.getLogger(__name__)
-        self._original_positions = {}
-        self._original_properties = {}
-        self._already_hidden = []
+        self._logger = _PluginLog(logging.getLogger(__name__))
+        self._snapshots = {}
+        # insertion-ordered set: keys are hidden element names, values unused
+        self._already_hidden = {}
+        self._state_signature = None
         self._face_element = None
+        self._face_resolver = _FaceResolver()
         self._ui = None
         self._enabled = True
+        self._hide_mode = "filter"
+        self._extra_pets = []
+        self._swarm = None
+        self._visible_key = None
+        self._visible_elements = []
+        self._obstacle_layout = None
+        self._render_filter = None
+        self._use_sprites = True
+        self._sprite_draw = None
 
-        self._pet_x = 50.0
-        self._pet_y = 50.0
-        self._pet_velocity_x = 1.5
-        self._pet_velocity_y = 1.0
-        self._pet_direction_x = 1
-        self._pet_direction_y = 1
         self._screen_width = 250
         self._screen_height = 122
+        self._screen_size_known = False
         self._pet_size = 15
         self._movement_enabled = True
-        self._last_move_time = time.time()
-        self._move_interval = 0.05
+        self._physics = _PetPhysics(self._logger)
+        self._display_profile = DEFAULT_DISPLAY_PROFILE
+        self._pacer = _FramePacer()
+        self._idle = _IdleGovernor()
+        self._idle_state = _IdleGovernor.ACTIVE
+        self._position_writes = 0
+        self._writes_avoided = 0
+        # serializes _move_pet and set_pet_position, which both write the pet
+        self._move_lock = threading.Lock()
+
+        self._state_store = None
+        self._state_restored = False
+        self._saved_pet = None
+        self._config = None
+        self._config_mtime = None
+
+        self._clock = time.monotonic
+        self._recorder = None
+        self._stats = _HookStats()
+        self._dispatcher = _HookDispatcher(self._logger.name)
+        self._logger.addFilter(self._dispatcher)
+        # seconds spent importing the module, in __init__ and in on_ui_setup
+        self._load_times = {
+            "import": _import_time,
+            "init": time.perf_counter() - init_started,
+            "setup": None,
+        }
 
     def _save_original_state(self, ui, element_name, element):
         """Save original state of UI elements before hiding them"""
-        if element_name not in self._original_positions:
-            self._original_positions[element_name] = {}
-            self._original_properties[element_name] = {}
-
-            if hasattr(element, "xy"):
-                self._original_positions[element_name]["xy"] = element.xy
-
-            properties_to_save = [
-                "color",
-                "font",
-                "text_font",
-                "label_font",
-                "alt_font",
-                "label",
-                "size",
-                "width",
-                "height",
-                "scale",
-                "font_size",
-            ]
-            for prop in properties_to_save:
-                if hasattr(element, prop):
-                    self._original_properties[element_name][prop] = getattr(
-                        element, prop
-                    )
+        if element_name not in self._snapshots:
+            snapshot = ElementSnapshot.capture(element)
+            self._snapshots[element_name] = snapshot
 
             self._logger.debug(
-                "Saved original state for %s: pos=%s, props=%s"
-                % (
-                    element_name,
-                    self._original_positions[element_name],
-                    self._original_properties[element_name],
-                )
+                "Saved original state for %s: xy=%s, props=%s",
+                element_name,
+                snapshot.xy,
+                snapshot.names,
             )
 
-    def _hide_element(self, ui, element_name, element):
-        """Hide an element by moving it off-screen"""
-        try:
-            if hasattr(element, "xy"):
+    def _hide_elements(self, batch):
+        """Hide (name, element) pairs by leaving them out of rendering, or moving them off-screen"""
+        hidden = self._already_hidden
+        offscreen = self._render_filter is None
+        failed = 0
+        for element_name, element in batch:
+            hidden[element_name] = None
+            if offscreen and hasattr(element, "xy"):
+                try:
+                    element.xy = (-9999, -9999)
+                except Exception:
+                    failed += 1
+        if failed:
+            self._logger.warning("Failed to hide %d elements", failed)
+
+    def _show_elements(self, ui, element_names):
+        """Restore elements to their saved state, return how many were restored"""
+        state = ui._state._state
+        snapshots = self._snapshots
+        restored = failed = 0
+        for element_name in element_names:
+            snapshot = snapshots.get(element_name)
+            element = state.get(element_name)
+            if snapshot is None or element is None:
+                continue
+            try:
+                snapshot.restore(element)
+                restored += 1
+            except Exception as err:
+                failed += 1
+                self._logger.debug(
+                    "Failed to restore element %s: %s", element_name, repr(err)
+                )
+        if failed:
+            self._logger.warning("Failed to restore %d elements", failed)
+        return restored
 
-                element.xy = (-9999, -9999)
-                self._logger.debug("Hidden element: %s" % element_name)
+    def _install_render_filter(self, ui):
+        """Start filtering hidden elements out of the view's draw loop"""
+        if self._hide_mode != "filter" or self._render_filter is not None:
+            return
+        try:
+            render_filter = _RenderFilter(ui._state, self._already_hidden)
+            render_filter.install()
+            self._render_filter = render_filter
         except Exception as err:
             self._logger.warning(
-                "Failed to hide element %s: %s" % (element_name, repr(err))
+                "Cannot filter hidden elements, moving them off-screen instead: %s",
+                repr(err),
             )
 
-    def _show_element(self, ui, element_name):
-        """Restore an element to its original position"""
-        try:
-            if (
-                element_name in self._original_positions
-                and element_name in ui._state._state
-            ):
-                element = ui._state._state[element_name]
-                if "xy" in self._original_positions[element_name]:
-                    element.xy = self._original_positions[element_name]["xy"]
-
-                for prop, value in self._original_properties[element_name].items():
-                    if hasattr(element, prop):
-                        setattr(element, prop, value)
+    def _remove_render_filter(self):
+        """Stop filtering the view's draw loop"""
+        if self._render_filter is not None:
+            self._render_filter.remove()
+            self._render_filter = None
 
-                self._logger.debug(
-                    "Restored element: %s to %s"
-                    % (element_name, self._original_positions[element_name]["xy"])
-                )
+    def _install_sprite_draw(self, ui, face_element_name):
+        """Draw the face from the sprite cache instead of laying out its text each frame"""
+        if not self._use_sprites or self._sprite_draw is not None:
+            return
+        try:
+            sprite_draw = _SpriteDraw(ui._state._state[face_element_name])
+            sprite_draw.install()
+            self._sprite_draw = sprite_draw
         except Exception as err:
-            self._logger.warning(
-                "Failed to restore element %s: %s" % (element_name, repr(err))
-            )
+            self._logger.warning("Cannot draw the face as a sprite: %s", repr(err))
+
+    def _remove_sprite_draw(self):
+        """Let the face element draw itself again"""
+        if self._sprite_draw is not None:
+            self._sprite_draw.remove()
+            self._sprite_draw = None
 
     def _get_screen_dimensions(self, ui):
         """Get the actual screen dimensions with fallbacks"""
@@ -150,84 +1936,46 @@ class Incognito(plugins.Plugin):
             if not height:
                 height = 122
 
-            common_sizes = {
-                (250, 122): 'Waveshare 2.13"',
-                (128, 64): "OLED 128x64",
-                (128, 32): "OLED 128x32",
-                (296, 128): 'Waveshare 2.9"',
-                (400, 300): 'Waveshare 4.2"',
-                (212, 104): 'Waveshare 2.13" v2',
-            }
-
-            display_type = common_sizes.get((width, height), "Unknown")
-            self._logger.info(
-                "Detected display: %dx%d (%s)" % (width, height, display_type)
+            self._display_profile = self._get_display_profile(width, height)
+            self._logger.debug(
+                "Detected display: %dx%d (%s)",
+                width,
+                height,
+                self._display_profile.name,
             )
 
             return width, height
 
         except Exception as err:
-            self._logger.warning(
-                "Could not determine screen dimensions: %s" % repr(err)
-            )
+            self._logger.warning("Could not determine screen dimensions: %s", repr(err))
             return 250, 122
 
+    @_timed
     def _find_face_element(self, ui):
-        """Find the face element in the UI state with improved detection"""
+        """Find the face element in the UI state, re-scoring only when elements changed"""
         state = ui._state._state
+        resolver = self._face_resolver
 
-        face_candidates = [
-            "face",
-            "Face",
-            "FACE",
-            "status",
-            "Status",
-            "STATUS",
-            "mood",
-            "Mood",
-            "MOOD",
-            "emoji",
-            "Emoji",
-            "EMOJI",
-            "expression",
-            "Expression",
-        ]
-
-        for candidate in face_candidates:
-            if candidate in state:
-                self._logger.info("Found face element (exact match): %s" % candidate)
-                return candidate
-
-        face_element = None
-        for element_name, element in state.items():
-            element_name_lower = element_name.lower()
-
-            face_keywords = ["face", "status", "mood", "emoji", "expression", "smile"]
-            if any(keyword in element_name_lower for keyword in face_keywords):
-                self._logger.info(
-                    "Found face element (keyword match): %s" % element_name
-                )
-                face_element = element_name
-                break
-
-            if hasattr(element, "draw"):
-
-                if hasattr(element, "value") or hasattr(element, "text"):
-                    face_element = element_name
-                    self._logger.info(
-                        "Found potential face element (drawable): %s" % element_name
-                    )
-
-        if face_element:
-            return face_element
+        if resolver.is_cached(state):
+            return resolver.choice
 
-        for element_name, element in state.items():
-            if hasattr(element, "draw"):
-                self._logger.warning("Using fallback face element: %s" % element_name)
-                return element_name
+        face_element = resolver.resolve(state)
+        if face_element is None:
+            self._logger.warning("Could not find any face element!")
+            return None
 
-        self._logger.warning("Could not find any face element!")
-        return None
+        score, reason = resolver.scores[face_element]
+        if score <= _FaceResolver.DRAWABLE_SCORE:
+            self._logger.warning("Using fallback face element: %s", face_element)
+        else:
+            self._logger.info(
+                "Found face element (%s, score %d of %d candidates): %s",
+                reason,
+                score,
+                len(resolver.scores),
+                face_element,
+            )
+        return face_element
 
     def _setup_pet_face(self, ui, face_element_name):
         """Setup the face as a small pet and initialize movement"""
@@ -235,9 +1983,13 @@ class Incognito(plugins.Plugin):
             if face_element_name and face_element_name in ui._state._state:
                 face_element = ui._state._state[face_element_name]
 
-                self._screen_width, self._screen_height = self._get_screen_dimensions(
-                    ui
-                )
+                if not self._screen_size_known:
+                    self._screen_width, self._screen_height = (
+                        self._get_screen_dimensions(ui)
+                    )
+                    self._screen_size_known = True
+
+                import pwnagotchi.ui.fonts as fonts
 
                 if hasattr(face_element, "font"):
                     pet_fonts = [fonts.Small, fonts.Medium, fonts.BoldSmall]
@@ -245,7 +1997,7 @@ class Incognito(plugins.Plugin):
                     for font in pet_fonts:
                         try:
                             face_element.font = font
-                            self._logger.info("Applied pet font: %s" % str(font))
+                            self._logger.debug("Applied pet font: %s", str(font))
                             break
                         except Exception as e:
                             continue
@@ -256,161 +2008,494 @@ class Incognito(plugins.Plugin):
                     except:
                         pass
 
-                self._pet_x = float(self._screen_width // 2)
-                self._pet_y = float(self._screen_height // 2)
+                self._configure_pacing()
+
+                self._physics.reset(self._get_pet_bounds(face_element))
+                pet = self._physics.state
 
                 if hasattr(face_element, "xy"):
-                    face_element.xy = (int(self._pet_x), int(self._pet_y))
-                    self._logger.info(
-                        "Set initial pet position: (%.1f, %.1f)"
-                        % (self._pet_x, self._pet_y)
+                    face_element.xy = (int(pet.x), int(pet.y))
+                    self._logger.debug(
+                        "Set initial pet position: (%.1f, %.1f)", pet.x, pet.y
                     )
                 else:
                     self._logger.warning("Face element has no 'xy' attribute!")
 
-                import random
-
-                self._pet_direction_x = random.choice([-1, 1])
-                self._pet_direction_y = random.choice([-1, 1])
-                self._pet_velocity_x = random.uniform(0.8, 2.0)
-                self._pet_velocity_y = random.uniform(0.5, 1.5)
-
                 self._movement_enabled = True
-                self._last_move_time = time.time()
-
-                self._logger.info(
-                    "Setup pet face '%s' at (%.1f, %.1f) on %dx%d screen, velocity=(%.2f,%.2f), direction=(%d,%d)"
-                    % (
-                        face_element_name,
-                        self._pet_x,
-                        self._pet_y,
-                        self._screen_width,
-                        self._screen_height,
-                        self._pet_velocity_x,
-                        self._pet_velocity_y,
-                        self._pet_direction_x,
-                        self._pet_direction_y,
-                    )
+
+                self._logger.debug(
+                    "Setup pet face '%s' at (%.1f, %.1f) on %dx%d screen, pattern=%s",
+                    face_element_name,
+                    pet.x,
+                    pet.y,
+                    self._screen_width,
+                    self._screen_height,
+                    self._physics.pattern_name,
                 )
             else:
                 self._logger.error(
-                    "Face element '%s' not found in UI state!" % face_element_name
+                    "Face element '%s' not found in UI state!", face_element_name
                 )
         except Exception as err:
-            self._logger.warning("Failed to setup pet face: %s" % repr(err))
+            self._logger.warning("Failed to setup pet face: %s", repr(err))
 
-    def _move_pet(self, ui):
-        """Move the pet face around the screen with smooth, accurate border collision"""
-        try:
-            current_time = time.time()
-
-            if current_time - self._last_move_time < self._move_interval:
-                return
+    @_timed
+    def _move_pet(self, ui, force=False):
+        """Bring the pet up to date with the physics clock and place it on screen.
 
+        Hooks only sample the engine; with ``force`` one extra step is taken
+        right away regardless of the clock.
+        """
+        try:
             if not self._movement_enabled:
-                self._logger.info("Movement disabled - not moving pet")
-                return
+                return False
 
             if not self._face_element:
-                self._logger.info("No face element found - cannot move pet")
-                return
+                self._logger.limited(
+                    "no-face", logging.INFO, "No face element found - cannot move pet"
+                )
+                return False
 
             if self._face_element not in ui._state._state:
-                self._logger.info(
-                    "Face element '%s' not in UI state" % self._face_element
+                self._logger.limited(
+                    "face-missing",
+                    logging.INFO,
+                    "Face element '%s' not in UI state",
+                    self._face_element,
                 )
-                return
+                return False
 
-            face_element = ui._state._state[self._face_element]
+            # one writer at a time from the clock read to the xy write, so a
+            # slower hook can not write an older position over a newer one
+            with self._move_lock:
+                now = self._clock()
+                idle_state = self._idle.state(now)
+                if idle_state != self._idle_state:
+                    self._idle_state = idle_state
+                    self._logger.info(
+                        "Pet is %s after %d s without peers, handshakes or web "
+                        "requests",
+                        idle_state,
+                        self._idle.idle_time(now),
+                    )
+                if idle_state == _IdleGovernor.PARKED and not force:
+                    return False
 
-            old_x, old_y = self._pet_x, self._pet_y
+                face_element = ui._state._state[self._face_element]
+                physics = self._physics
 
-            next_x = self._pet_x + (self._pet_velocity_x * self._pet_direction_x)
-            next_y = self._pet_y + (self._pet_velocity_y * self._pet_direction_y)
+                bounds = self._get_pet_bounds(face_element)
+                if bounds != physics.state.bounds:
+                    physics.set_bounds(bounds)
+                self._update_obstacles(ui, face_element)
 
-            margin = self._pet_size
+                old = physics.state
 
-            if next_x <= margin:
-                next_x = margin
-                self._pet_direction_x = 1
-                import random
+                steps = physics.advance(now, extra_steps=1 if force else 0)
 
-                self._pet_velocity_x = random.uniform(0.8, 2.0)
-                self._logger.info("Pet hit left boundary, bouncing right")
+                slowdown = (
+                    self._idle.slowdown if idle_state == _IdleGovernor.SLOW else 1.0
+                )
+                if not steps or not (force or self._pacer.ready(now, slowdown)):
+                    return False
 
-            elif next_x >= (self._screen_width - margin):
-                next_x = self._screen_width - margin
-                self._pet_direction_x = -1
-                import random
+                swarm_moved = 0
+                if self._swarm is not None:
+                    swarm_moved = self._move_swarm(ui, steps)
 
-                self._pet_velocity_x = random.uniform(0.8, 2.0)
-                self._logger.info("Pet hit right boundary, bouncing left")
+                pet = physics.state
+                if hasattr(face_element, "xy"):
+                    old_box = self._get_element_box(face_element)
+                    if not self._write_pet_xy(face_element, pet.x, pet.y):
+                        if swarm_moved:
+                            self._pacer.mark(now)
+                        return False
+                    self._mark_dirty(ui, old_box, self._get_element_box(face_element))
+                    self._pacer.mark(now)
+                    self._logger.limited(
+                        "move",
+                        logging.DEBUG,
+                        "Pet moved smoothly from (%.1f,%.1f) to (%.1f,%.1f)",
+                        old.x,
+                        old.y,
+                        pet.x,
+                        pet.y,
+                    )
+                    return True
+                else:
+                    self._logger.limited(
+                        "no-xy",
+                        logging.WARNING,
+                        "Face element has no 'xy' attribute - cannot move!",
+                    )
+                    return False
 
-            if next_y <= margin:
-                next_y = margin
-                self._pet_direction_y = 1
-                import random
+        except Exception as err:
+            self._logger.limited(
+                "move-failed", logging.ERROR, "Failed to move pet: %s", repr(err)
+            )
+            return False
 
-                self._pet_velocity_y = random.uniform(0.5, 1.5)
-                self._logger.info("Pet hit top boundary, bouncing down")
+    def _get_element_extent(self, element):
+        """Measure the (left, top, right, bottom) box of an element relative to its xy"""
+        font = getattr(element, "font", None) or getattr(element, "text_font", None)
+        text = getattr(element, "value", None)
+        label = getattr(element, "label", None)
+        if label is not None and text is not None:
+            text = "%s %s" % (label, text)
+        if font is None or text is None:
+            return None
+        try:
+            return _measure_text(font, str(text))
+        except Exception as err:
+            self._logger.debug("Cannot measure element: %s", repr(err))
+            return None
+
+    def _get_pet_bounds(self, element):
+        """Get the area a pet's xy may roam in, from the measured size of the element.
+
+        The element is also kept ``margin`` pixels away from the screen edges. Falls
+        back to a fixed _pet_size margin when the element cannot be measured.
+        """
+        edge = self._config.margin if self._config is not None else 0
+        extent = self._get_element_extent(element)
+        if extent is not None:
+            left, top, right, bottom = extent
+            min_x, min_y = edge - left, edge - top
+            max_x = max(min_x, self._screen_width - edge - right)
+            max_y = max(min_y, self._screen_height - edge - bottom)
+            return (min_x, min_y, max_x, max_y)
+
+        margin = self._pet_size + edge
+        return (
+            margin,
+            margin,
+            max(margin, self._screen_width - margin),
+            max(margin, self._screen_height - margin),
+        )
 
-            elif next_y >= (self._screen_height - margin):
-                next_y = self._screen_height - margin
-                self._pet_direction_y = -1
-                import random
+    def _get_element_box(self, element):
+        """Get the on-screen (x0, y0, x1, y1) box of an element, or None"""
+        xy = getattr(element, "xy", None)
+        if not isinstance(xy, (tuple, list)):
+            return None
+        if len(xy) == 4:
+            return tuple(xy)
+        if len(xy) != 2:
+            return None
+
+        extent = self._get_element_extent(element)
+        if extent is None:
+            return None
+        x, y = xy
+        box = (x + extent[0], y + extent[1], x + extent[2], y + extent[3])
+        if box[2] < 0 or box[3] < 0:
+            return None
+        if box[0] > self._screen_width or box[1] > self._screen_height:
+            return None
+        return box
+
+    def _update_obstacles(self, ui, face_element):
+        """Rebuild the obstacle grid when the visible elements changed.
+
+        The list of visible elements is only recomputed when elements are added
+        or hidden; after that only their positions and values are compared.
+        """
+        state = ui._state._state
+        key = (_state_signature(state), len(self._already_hidden), self._swarm)
+        if key != self._visible_key:
+            self._visible_key = key
+            hidden = self._already_hidden
+            pets = self._swarm.names if self._swarm is not None else ()
+            self._visible_elements = [
+                element
+                for name, element in state.items()
+                if name != self._face_element
+                and name not in hidden
+                and name not in pets
+            ]
 
-                self._pet_velocity_y = random.uniform(0.5, 1.5)
-                self._logger.info("Pet hit bottom boundary, bouncing up")
+        visible = self._visible_elements
+        if not visible and self._obstacle_layout is None:
+            return
 
-            self._pet_x = next_x
-            self._pet_y = next_y
+        extent = self._get_element_extent(face_element)
+        layout = (
+            extent,
+            tuple(
+                (getattr(element, "xy", None), getattr(element, "value", None))
+                for element in visible
+            ),
+        )
+        if layout == self._obstacle_layout:
+            return
+        self._obstacle_layout = layout if visible else None
 
-            if hasattr(face_element, "xy"):
-                face_element.xy = (int(self._pet_x), int(self._pet_y))
-                self._logger.info(
-                    "Pet moved smoothly from (%.1f,%.1f) to (%.1f,%.1f)"
-                    % (old_x, old_y, self._pet_x, self._pet_y)
+        if extent is None:
+            margin = self._pet_size
+            extent = (-margin, -margin, margin, margin)
+        left, top, right, bottom = extent
+
+        boxes = []
+        for element in visible:
+            box = self._get_element_box(element)
+            if box is not None:
+                boxes.append(
+                    (box[0] - right, box[1] - bottom, box[2] - left, box[3] - top)
                 )
+
+        self._physics.set_obstacles(_SpatialGrid(boxes) if boxes else None)
+        self._logger.debug("Pet avoids %d visible elements", len(boxes))
+
+    def _setup_swarm(self, ui):
+        """Start moving the extra_pets elements, if NumPy is available"""
+        self._swarm = None
+        state = ui._state._state
+        never_show = self._config.never_show if self._config is not None else ()
+        names = [
+            name
+            for name in self._extra_pets
+            if name in state and name != self._face_element and name not in never_show
+        ]
+        if not names:
+            return
+
+        try:
+            import numpy
+        except ImportError:
+            self._logger.warning("Multi-pet mode needs numpy - extra pets disabled")
+            return
+
+        swarm = _PetSwarm(numpy, names, self._physics.rng.getrandbits(32))
+        swarm.set_bounds([self._get_pet_bounds(state[name]) for name in names])
+        swarm.scatter()
+        self._swarm = swarm
+        self._logger.debug("Multi-pet mode with %d extra pets: %s", len(names), names)
+
+    def _move_swarm(self, ui, steps):
+        """Step the extra pets and write their positions, return how many moved"""
+        state = ui._state._state
+        pets = [state[name] for name in self._swarm.names if name in state]
+        old_boxes = [self._get_element_box(pet) for pet in pets]
+        self._swarm.step(steps)
+        moved = self._swarm.write(state, self._display_profile.step)
+        if moved:
+            self._mark_dirty(
+                ui, *old_boxes, *[self._get_element_box(pet) for pet in pets]
+            )
+        return moved
+
+    def _mark_dirty(self, ui, *boxes):
+        """Grow the view's dirty rectangle to cover ``boxes``, clipped to the screen"""
+        rect = getattr(ui, DIRTY_RECT_ATTR, None)
+        for box in boxes:
+            if box is None:
+                continue
+            if rect is None:
+                rect = box
             else:
-                self._logger.warning(
-                    "Face element has no 'xy' attribute - cannot move!"
+                rect = (
+                    min(rect[0], box[0]),
+                    min(rect[1], box[1]),
+                    max(rect[2], box[2]),
+                    max(rect[3], box[3]),
                 )
+        if rect is None:
+            return
 
-            self._last_move_time = current_time
+        rect = (
+            max(0, int(rect[0])),
+            max(0, int(rect[1])),
+            min(self._screen_width, int(math.ceil(rect[2]))),
+            min(self._screen_height, int(math.ceil(rect[3]))),
+        )
+        if rect[0] >= rect[2] or rect[1] >= rect[3]:
+            return
+        try:
+            setattr(ui, DIRTY_RECT_ATTR, rect)
+        except AttributeError:
+            pass
 
-            import random
+    def _write_pet_xy(self, face_element, x, y):
+        """Assign the pet position to the face element only if it moved enough pixels"""
+        new_x, new_y = int(x), int(y)
+        try:
+            old_x, old_y = face_element.xy
+        except (TypeError, ValueError):
+            old_x, old_y = None, None
 
-            if random.random() < 0.03:
+        step = self._display_profile.step
+        if old_x is not None and (
+            abs(new_x - old_x) < step and abs(new_y - old_y) < step
+        ):
+            self._writes_avoided += 1
+            return False
 
-                velocity_change = random.uniform(-0.2, 0.2)
-                self._pet_velocity_x = max(
-                    0.5, min(2.5, self._pet_velocity_x + velocity_change)
-                )
-                self._pet_velocity_y = max(
-                    0.3, min(2.0, self._pet_velocity_y + velocity_change)
-                )
-                self._logger.info(
-                    "Pet velocity adjusted for organic movement: (%.2f,%.2f)"
-                    % (self._pet_velocity_x, self._pet_velocity_y)
-                )
+        face_element.xy = (new_x, new_y)
+        self._position_writes += 1
+        return True
 
-            if random.random() < 0.01:
-                self._pet_direction_x = random.choice([-1, 1])
-                self._pet_direction_y = random.choice([-1, 1])
-                self._pet_velocity_x = random.uniform(0.8, 2.0)
-                self._pet_velocity_y = random.uniform(0.5, 1.5)
-                self._logger.info(
-                    "Pet randomly changed direction: dir=(%d,%d), vel=(%.2f,%.2f)"
-                    % (
-                        self._pet_direction_x,
-                        self._pet_direction_y,
-                        self._pet_velocity_x,
-                        self._pet_velocity_y,
-                    )
-                )
+    def _configure_pacing(self):
+        """Pace frames for the display profile and step the physics at least as often.
+
+        The physics timestep is the configured one, shortened to one frame of
+        the profile's frame rate so fast displays (OLED) get a new position on
+        every frame they may show.
+        """
+        profile = self._display_profile
+        self._pacer.configure(profile)
+        timestep = self._config.timestep if self._config is not None else 0.05
+        if profile.frame_rate > 0:
+            timestep = min(timestep, 1.0 / profile.frame_rate)
+        self._physics.timestep = timestep
+
+    def _get_display_profile(self, width, height):
+        """Get the display profile for a screen size, with option overrides applied"""
+        profile = DISPLAY_PROFILES.get((width, height), DEFAULT_DISPLAY_PROFILE)
+
+        overrides = {}
+        for option, field, cast, minimum in (
+            ("frame_rate", "frame_rate", float, 0.0),
+            ("max_refreshes_per_minute", "max_refreshes_per_minute", int, 0),
+            ("min_pixel_delta", "step", int, 1),
+        ):
+            configured = getattr(self._config, option, None)
+            if isinstance(configured, dict):
+                configured = configured.get(profile.name)
+            if configured is None:
+                continue
+            try:
+                overrides[field] = max(minimum, cast(configured))
+            except (TypeError, ValueError):
+                self._logger.warning("Invalid %s: %s", option, repr(configured))
+
+        return profile._replace(**overrides)
+
+    def _persisted_state(self, pet):
+        """Return the face, display, element snapshots and ``pet`` as JSON data"""
+        elements = {}
+        for element_name, snapshot in self._snapshots.items():
+            properties = {}
+            for prop, value in zip(snapshot.names, snapshot.values):
+                value = _jsonable(value)
+                if value is not None:
+                    properties[prop] = value
+            elements[element_name] = {
+                "xy": _jsonable(snapshot.xy),
+                "properties": properties,
+            }
+        return {
+            "version": STATE_VERSION,
+            "display": {
+                "width": self._screen_width,
+                "height": self._screen_height,
+                "profile": self._display_profile.name,
+            },
+            "face_element": self._face_element,
+            "elements": elements,
+            "pet": pet,
+        }
 
-        except Exception as err:
-            self._logger.error("Failed to move pet: %s" % repr(err))
+    def _save_state(self, force=False):
+        """Write the persisted state, at most once per state_save_interval unless forced.
+
+        The pet position changes all the time, so only forced saves (on unload)
+        record the current one; the others keep the last recorded position and
+        write nothing while the UI stays the same.
+        """
+        if self._state_store is None or not self._face_element:
+            return
+        if force:
+            pet = self._physics.state
+            self._saved_pet = {"x": round(pet.x, 1), "y": round(pet.y, 1)}
+        try:
+            data = self._persisted_state(self._saved_pet)
+            if self._state_store.save(data, force=force):
+                self._logger.debug("Saved state to %s", self._state_store.path)
+        except (OSError, TypeError, ValueError) as err:
+            self._logger.limited(
+                "save_state", logging.WARNING, "Could not save state: %s", repr(err)
+            )
+
+    def _load_state(self, ui):
+        """Reuse the saved face element if the saved UI matches the live one.
+
+        The saved display size is not probed again: pwnagotchi lays elements
+        out per display, so matching element positions confirm it. Returns the
+        saved pet state, or None when there was nothing to restore.
+        """
+        if self._state_store is None:
+            return None
+        data = self._state_store.load()
+        if data is None:
+            return None
+
+        state = ui._state._state
+        face_element = data.get("face_element")
+        elements = data.get("elements") or {}
+        display = data.get("display") or {}
+        width, height = display.get("width"), display.get("height")
+
+        mismatch = None
+        if not (isinstance(width, int) and isinstance(height, int)):
+            mismatch = "display size"
+        elif self._get_display_profile(width, height).name != display.get("profile"):
+            mismatch = "display profile"
+        elif face_element not in state or face_element in self._face_resolver.excluded:
+            mismatch = "face element"
+        elif not set(state) <= set(elements):
+            mismatch = "new elements"
+        else:
+            for element_name in state:
+                saved = elements[element_name]
+                snapshot = ElementSnapshot.capture(state[element_name])
+                live = snapshot.properties()
+                if saved.get("xy") != _jsonable(snapshot.xy) or any(
+                    _jsonable(live.get(prop)) != value
+                    for prop, value in saved.get("properties", {}).items()
+                ):
+                    mismatch = "element " + element_name
+                    break
+
+        if mismatch is not None:
+            self._logger.info("Saved state does not match the UI (%s)", mismatch)
+            return None
+
+        # the element layout matched, so the saved screen size is the live one
+        self._screen_width, self._screen_height = width, height
+        self._display_profile = self._get_display_profile(width, height)
+        self._screen_size_known = True
+        self._saved_pet = data.get("pet")
+        self._face_resolver.prime(state, face_element)
+        self._logger.info(
+            "Restored face element %s from %s", face_element, self._state_store.path
+        )
+        return data.get("pet")
+
+    def _restore_pet(self, pet):
+        """Put the pet back where the saved state left it"""
+        try:
+            self.set_pet_position(float(pet["x"]), float(pet["y"]))
+            self._state_restored = True
+        except (KeyError, TypeError, ValueError) as err:
+            self._logger.warning("Could not restore pet state: %s", repr(err))
+
+    def _set_clock(self, clock):
+        """Use ``clock`` instead of time.monotonic() for movement and rate limits"""
+        self._clock = clock
+        self._physics.clock = clock
+        self._physics.sync_clock()
+        self._dispatcher.clock = clock
+        self._idle.wake(clock())
+
+    def _wake_pet(self, reason):
+        """Report activity to the idle governor, resuming a slowed or parked pet"""
+        now = self._clock()
+        previous = self._idle.wake(now)
+        if previous != _IdleGovernor.ACTIVE:
+            self._idle_state = _IdleGovernor.ACTIVE
+            self._physics.sync_clock(now)
+            self._logger.info("Pet woke up from %s (%s)", previous, reason)
 
     def _pause_pet_movement(self):
         """Pause pet movement"""
@@ -418,15 +2503,259 @@ class Incognito(plugins.Plugin):
 
     def _resume_pet_movement(self):
         """Resume pet movement"""
+        self._physics.sync_clock()
         self._movement_enabled = True
 
     def _set_pet_speed(self, speed_multiplier=1.0):
         """Set pet movement speed (1.0 = normal, 2.0 = double speed, 0.5 = half speed)"""
-        base_interval = 0.05
-        self._move_interval = base_interval / speed_multiplier
+        self._physics.speed = float(speed_multiplier)
+
+    def _should_hide(self, element_name, face_element_name):
+        """Check if an element is hidden in incognito mode under the current config"""
+        config = self._config
+        if config is not None and element_name in config.never_show:
+            return True
+        if element_name == face_element_name or element_name in self._extra_pets:
+            return False
+        return config is None or element_name not in config.never_hide
+
+    def _apply_config(self, config):
+        """Switch to ``config``, changing only what differs from the current one.
+
+        Returns the names of the changed options. Screen size and face detection
+        are never redone here; the UI is only touched for the options that need
+        it, and only when incognito mode is on.
+        """
+        previous = self._config
+        self._config = config
+        if previous is None:
+            changed = set(config._fields)
+        else:
+            changed = {
+                name
+                for name in config._fields
+                if getattr(config, name) != getattr(previous, name)
+            }
+        if not changed:
+            return changed
+
+        physics = self._physics
+        if "seed" in changed and config.seed is not None:
+            physics.rng.seed(config.seed)
+        if "pattern" in changed and config.pattern != physics.pattern_name:
+            physics.set_pattern(config.pattern)
+        if changed & {"pattern", "never_hide"}:
+            self._check_pattern_obstacles()
+        self._set_pet_speed(config.speed)
+        if previous is None:
+            physics.timestep = config.timestep
+        self._pet_size = config.pet_size
+        self._dispatcher.configure(
+            max_moves_per_second=config.max_hook_moves_per_second,
+            merge_window=config.hook_merge_window,
+        )
+        self._idle.configure(
+            slow_after=config.idle_slow_after,
+            park_after=config.idle_park_after,
+            slowdown=config.idle_slowdown,
+        )
+        if "never_show" in changed:
+            self._face_resolver.excluded = frozenset(config.never_show)
+            self._face_resolver.invalidate()
+
+        if changed & {"state_file", "state_save_interval"}:
+            self._state_store = (
+                _StateStore(config.state_file, config.state_save_interval)
+                if config.state_file
+                else None
+            )
+        if "trace_file" in changed:
+            if config.trace_file:
+                self.start_trace(config.trace_file)
+            else:
+                self.stop_trace()
+
+        if previous is None:
+            self._enabled = config.enabled
+            self._hide_mode = config.hide_mode
+            self._extra_pets = list(config.extra_pets)
+            self._use_sprites = config.sprites
+            return changed
+
+        if changed & {"frame_rate", "max_refreshes_per_minute", "min_pixel_delta"}:
+            self._display_profile = self._get_display_profile(
+                self._screen_width, self._screen_height
+            )
+        if changed & {
+            "timestep",
+            "frame_rate",
+            "max_refreshes_per_minute",
+            "min_pixel_delta",
+        }:
+            self._configure_pacing()
+        if changed & {"pet_size", "margin"}:
+            self._obstacle_layout = None
+
+        ui = self._ui
+        if "enabled" in changed and config.enabled != self._enabled:
+            self._hide_mode = config.hide_mode
+            self._extra_pets = list(config.extra_pets)
+            self._use_sprites = config.sprites
+            self.toggle_mode()
+            return changed
+
+        if "sprites" in changed:
+            self._use_sprites = config.sprites
+            if ui is not None and self._enabled and self._face_element:
+                if config.sprites:
+                    self._install_sprite_draw(ui, self._face_element)
+                else:
+                    self._remove_sprite_draw()
 
+        rules = changed & {"hide_mode", "never_hide", "never_show", "extra_pets"}
+        if rules:
+            if ui is not None and self._enabled:
+                self._update_hidden(ui, config, rules)
+            else:
+                self._hide_mode = config.hide_mode
+                self._extra_pets = list(config.extra_pets)
+        return changed
+
+    def _update_hidden(self, ui, config, rules):
+        """Show and hide only the elements whose visibility the changed ``rules`` affect"""
+        state = ui._state._state
+        hidden = self._already_hidden
+
+        with _ViewLock(ui):
+            if "never_show" in rules and self._face_element in config.never_show:
+                self._replace_face(ui)
+
+            if "hide_mode" in rules:
+                self._show_elements(ui, list(hidden))
+                hidden.clear()
+                self._remove_render_filter()
+                self._hide_mode = config.hide_mode
+                self._install_render_filter(ui)
+
+            # never_show can take an element away from the swarm
+            swarm_rules = rules & {"extra_pets", "never_show"}
+            if swarm_rules:
+                if self._swarm is not None:
+                    self._show_elements(ui, self._swarm.names)
+                    self._swarm = None
+                self._extra_pets = list(config.extra_pets)
+
+            shown = [
+                element_name
+                for element_name in hidden
+                if not self._should_hide(element_name, self._face_element)
+            ]
+            self._show_elements(ui, shown)
+            for element_name in shown:
+                del hidden[element_name]
+
+            batch = []
+            for element_name, element in list(state.items()):
+                if element_name not in hidden and self._should_hide(
+                    element_name, self._face_element
+                ):
+                    self._save_original_state(ui, element_name, element)
+                    batch.append((element_name, element))
+            self._hide_elements(batch)
+
+            if swarm_rules:
+                self._setup_swarm(ui)
+            self._visible_key = None
+            self._state_signature = None
+            self._mark_dirty(ui, (0, 0, self._screen_width, self._screen_height))
+
+        self._logger.info(
+            "Updated hidden elements - showing %d, hiding %d", len(shown), len(batch)
+        )
+
+    def _replace_face(self, ui):
+        """Give the pet role to the best face element not excluded by never_show"""
+        old_face = self._face_element
+        self._remove_sprite_draw()
+        self._show_elements(ui, [old_face])
+        self._face_element = None
+
+        face_element_name = self._find_face_element(ui)
+        if face_element_name:
+            # the new face may have been hidden; it is placed by _setup_pet_face,
+            # not restored to its saved position
+            self._already_hidden.pop(face_element_name, None)
+            self._setup_pet_face(ui, face_element_name)
+            self._face_element = face_element_name
+            self._install_sprite_draw(ui, face_element_name)
+        self._logger.info(
+            "Face element %s is in never_show, pet is now %s",
+            old_face,
+            face_element_name,
+        )
+
+    def _check_pattern_obstacles(self):
+        """Warn when never_hide is set but the motion pattern cannot steer around it"""
+        config = self._config
+        pattern = self._physics.pattern_name
+        if config is not None and config.never_hide:
+            if not MOTION_PATTERNS[pattern].avoids_obstacles:
+                self._logger.warning(
+                    "The %s pattern follows a fixed path and may cover never_hide "
+                    "elements %s",
+                    pattern,
+                    ", ".join(config.never_hide),
+                )
+
+    def _get_config_mtime(self):
+        """Return the modification time of the watched config file, or None"""
+        path = self._config.config_file if self._config is not None else None
+        if not path:
+            return None
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _check_config_file(self):
+        """Reload this plugin's section of the config file if the file changed"""
+        mtime = self._get_config_mtime()
+        if mtime is None or mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+
+        path = self._config.config_file
+        try:
+            try:
+                import tomllib
+
+                with open(path, "rb") as config_file:
+                    config = tomllib.load(config_file)
+            except ImportError:
+                import toml
+
+                config = toml.load(path)
+        except Exception as err:
+            self._logger.limited(
+                "config-file",
+                logging.WARNING,
+                "Cannot read %s: %s",
+                path,
+                repr(err),
+            )
+            return
+
+        section = _plugin_section(config)
+        if section is not None:
+            self.reload_options(section)
+
+    @_timed
     def _apply_incognito_mode(self, ui):
-        """Apply incognito mode by hiding all elements except face"""
+        """Apply incognito mode by hiding all elements except face.
+
+        Element state is saved and the elements to hide are collected first;
+        all writes then happen in one pass while the view's lock is held.
+        """
         if not self._enabled:
             return
 
@@ -435,46 +2764,56 @@ class Incognito(plugins.Plugin):
 
             face_element_name = self._find_face_element(ui)
 
-            for element_name, element in state.items():
-                if element_name != face_element_name:
+            batch = []
+            for element_name, element in list(state.items()):
+                self._save_original_state(ui, element_name, element)
+                if self._should_hide(element_name, face_element_name):
+                    batch.append((element_name, element))
 
-                    self._save_original_state(ui, element_name, element)
-
-                    self._hide_element(ui, element_name, element)
+            with _ViewLock(ui) as view_lock:
+                self._install_render_filter(ui)
+                self._hide_elements(batch)
 
-                    if element_name not in self._already_hidden:
-                        self._already_hidden.append(element_name)
+                if face_element_name:
+                    self._setup_pet_face(ui, face_element_name)
+                    self._face_element = face_element_name
+                    self._install_sprite_draw(ui, face_element_name)
 
-            if face_element_name:
-                self._save_original_state(
-                    ui, face_element_name, state[face_element_name]
-                )
-                self._setup_pet_face(ui, face_element_name)
-                self._face_element = face_element_name
+                self._setup_swarm(ui)
+                self._mark_dirty(ui, (0, 0, self._screen_width, self._screen_height))
 
             self._logger.info(
-                "Incognito mode applied - showing roaming pet face: %s"
-                % face_element_name
+                "Incognito mode applied - hid %d elements, roaming pet face: %s%s",
+                len(batch),
+                face_element_name,
+                "" if view_lock.held else " (view not locked)",
             )
 
         except Exception as err:
-            self._logger.warning("Failed to apply incognito mode: %s" % repr(err))
+            self._logger.warning("Failed to apply incognito mode: %s", repr(err))
 
     def _restore_normal_mode(self, ui):
-        """Restore all UI elements to their original positions"""
+        """Restore all UI elements to their original state in one locked pass"""
         try:
-
-            for element_name in self._already_hidden:
-                self._show_element(ui, element_name)
-
+            element_names = list(self._already_hidden)
             if self._face_element:
-                self._show_element(ui, self._face_element)
+                element_names.append(self._face_element)
+            if self._swarm is not None:
+                element_names.extend(self._swarm.names)
+
+            with _ViewLock(ui):
+                self._remove_render_filter()
+                self._remove_sprite_draw()
+                restored = self._show_elements(ui, element_names)
+                self._swarm = None
+                self._already_hidden.clear()
+                self._state_signature = None
+                self._mark_dirty(ui, (0, 0, self._screen_width, self._screen_height))
 
-            self._already_hidden.clear()
-            self._logger.info("Restored normal UI mode")
+            self._logger.info("Restored normal UI mode - %d elements", restored)
 
         except Exception as err:
-            self._logger.warning("Failed to restore normal mode: %s" % repr(err))
+            self._logger.warning("Failed to restore normal mode: %s", repr(err))
 
     def toggle_mode(self):
         """Toggle between incognito pet mode and normal mode"""
@@ -482,14 +2821,20 @@ class Incognito(plugins.Plugin):
         if self._ui:
             if self._enabled:
                 self._apply_incognito_mode(self._ui)
-                self._logger.info("Incognito pet mode enabled")
             else:
                 self._restore_normal_mode(self._ui)
-                self._logger.info("Incognito pet mode disabled")
 
     def on_loaded(self):
         self._start = time.time()
-        self._logger.info("Incognito plugin loaded")
+
+        self._apply_config(parse_options(self.options, self._logger))
+        self._config_mtime = self._get_config_mtime()
+
+        self._logger.info(
+            "Incognito plugin loaded (import %.1f ms, init %.1f ms)",
+            self._load_times["import"] * 1000,
+            self._load_times["init"] * 1000,
+        )
 
     def on_ready(self, agent):
         self._agent = agent
@@ -497,27 +2842,40 @@ class Incognito(plugins.Plugin):
 
     def on_ui_setup(self, ui):
         """Called when UI is being set up"""
+        setup_started = time.perf_counter()
         self._ui = ui
 
-        if "enabled" in self.options:
-            self._enabled = self.options["enabled"]
+        if self._config is None:
+            self._apply_config(parse_options(self.options, self._logger))
+        self._wake_pet("setup")
 
         if self._enabled:
+            pet = self._load_state(ui)
             self._apply_incognito_mode(ui)
 
-            self._logger.info("Testing pet movement after setup...")
-            if self._face_element:
+            if pet is not None and self._face_element:
+                self._restore_pet(pet)
+            elif self._face_element:
+                self._logger.info("Testing pet movement after setup...")
                 for i in range(3):
-                    result = self._force_move_pet_now(ui)
+                    result = self._move_pet(ui, force=True)
+                    pet = self._physics.state
                     self._logger.info(
-                        "Setup test move %d: success=%s, position=(%d,%d)"
-                        % (i + 1, result, self._pet_x, self._pet_y)
+                        "Setup test move %d: success=%s, position=(%d,%d)",
+                        i + 1,
+                        result,
+                        pet.x,
+                        pet.y,
                     )
 
+        self._load_times["setup"] = time.perf_counter() - setup_started
         self._logger.info(
-            "Incognito UI setup complete - pet mode (enabled: %s)" % self._enabled
+            "Incognito UI setup complete - pet mode (enabled: %s) in %.1f ms",
+            self._enabled,
+            self._load_times["setup"] * 1000,
         )
 
+    @_timed
     def on_ui_update(self, ui):
         """Called on UI updates - maintain incognito mode and move the pet"""
         if self._enabled:
@@ -525,91 +2883,132 @@ class Incognito(plugins.Plugin):
             self._move_pet(ui)
 
             state = ui._state._state
-            for element_name, element in state.items():
-                if (
-                    element_name != self._face_element
-                    and element_name not in self._already_hidden
-                    and element_name not in self._original_positions
-                ):
+            signature = _state_signature(state)
+            if signature != self._state_signature:
+                self._state_signature = signature
+                self._hide_new_elements(ui, state)
+
+    def _hide_new_elements(self, ui, state):
+        """Hide elements that other plugins added since the last UI update"""
+        hidden = self._already_hidden
+        saved = self._snapshots
+        for element_name, element in list(state.items()):
+            if (
+                element_name not in hidden
+                and element_name not in saved
+                and self._should_hide(element_name, self._face_element)
+            ):
 
-                    self._save_original_state(ui, element_name, element)
-                    self._hide_element(ui, element_name, element)
-                    self._already_hidden.append(element_name)
+                self._save_original_state(ui, element_name, element)
+                self._hide_elements(((element_name, element),))
 
+    def on_config_changed(self, config):
+        """Called when the pwnagotchi config was edited at runtime - reload our section"""
+        section = _plugin_section(config)
+        if section is not None:
+            self.reload_options(section)
+
+    @_timed
     def on_epoch(self, agent, epoch, epoch_data):
         """Called on each epoch - also try to move pet here for more frequent updates"""
         if self._enabled and self._ui:
             self._move_pet(self._ui)
+            self._save_state()
+        self._check_config_file()
 
+    @_timed
     def on_peer_detected(self, agent, peer):
-        """Called when peer detected - move pet"""
+        """Called when peer detected - wake up and move pet"""
+        self._wake_pet("peer")
         if self._enabled and self._ui:
             self._move_pet(self._ui)
 
+    @_timed
     def on_handshake(self, agent, filename, access_point, client_station):
-        """Called on handshake - move pet"""
+        """Called on handshake - wake up and move pet"""
+        self._wake_pet("handshake")
         if self._enabled and self._ui:
             self._move_pet(self._ui)
 
+    @_timed
     def on_log(self, agent, entry):
-        """Called on every log message - move pet for constant movement"""
-        if self._enabled and self._ui:
-            self._force_move_pet_now(self._ui)
+        """Called on every log message - move pet, ignoring our own log entries"""
+        if self._enabled and self._ui and self._dispatcher.admit("log", entry):
+            with self._dispatcher.busy():
+                self._move_pet(self._ui)
 
+    @_timed
     def on_wifi_update(self, agent, access_points):
-        """Called on wifi updates - move pet"""
-        if self._enabled and self._ui:
-            self._force_move_pet_now(self._ui)
+        """Called on wifi updates - move pet, merging bursts of updates"""
+        if self._enabled and self._ui and self._dispatcher.admit("wifi"):
+            with self._dispatcher.busy():
+                self._move_pet(self._ui)
 
     def on_unload(self, ui):
         """Called when plugin is unloaded - restore normal mode"""
         try:
+            self._save_state(force=True)
             self._restore_normal_mode(ui)
             self._logger.info("Incognito plugin unloaded - UI restored")
         except Exception as err:
-            self._logger.warning("Error during unload: %s" % repr(err))
+            self._logger.warning("Error during unload: %s", repr(err))
 
     def on_unloaded(self):
         """Final cleanup"""
+        self._logger.removeFilter(self._dispatcher)
+        self.stop_trace()
+        self._logger.flush()
         self._logger.info("Incognito plugin unloaded completely")
 
     def get_hidden_elements(self):
         """Return list of currently hidden elements for tweak_view compatibility"""
-        return self._already_hidden.copy()
+        return list(self._already_hidden)
 
     def get_face_element(self):
         """Return the face element name for tweak_view compatibility"""
         return self._face_element
 
+    def get_face_scores(self):
+        """Get the face candidate scores behind the current face element choice"""
+        return {
+            element_name: {"score": score, "reason": reason}
+            for element_name, (score, reason) in self._face_resolver.scores.items()
+        }
+
     def is_incognito_enabled(self):
         """Check if incognito mode is currently enabled"""
         return self._enabled
 
     def get_original_positions(self):
         """Get original positions for tweak_view compatibility"""
-        return self._original_positions.copy()
+        return {
+            element_name: snapshot.position()
+            for element_name, snapshot in self._snapshots.items()
+        }
 
     def get_pet_position(self):
         """Get current pet position"""
-        return (self._pet_x, self._pet_y)
+        pet = self._physics.state
+        return (pet.x, pet.y)
 
     def set_pet_position(self, x, y):
         """Manually set pet position"""
-        self._pet_x = max(
-            self._pet_size, min(float(x), self._screen_width - self._pet_size)
-        )
-        self._pet_y = max(
-            self._pet_size, min(float(y), self._screen_height - self._pet_size)
-        )
+        with self._move_lock:
+            self._physics.place(x, y)
 
-        if (
-            self._ui
-            and self._face_element
-            and self._face_element in self._ui._state._state
-        ):
-            face_element = self._ui._state._state[self._face_element]
-            if hasattr(face_element, "xy"):
-                face_element.xy = (int(self._pet_x), int(self._pet_y))
+            if (
+                self._ui
+                and self._face_element
+                and self._face_element in self._ui._state._state
+            ):
+                face_element = self._ui._state._state[self._face_element]
+                if hasattr(face_element, "xy"):
+                    pet = self._physics.state
+                    old_box = self._get_element_box(face_element)
+                    if self._write_pet_xy(face_element, pet.x, pet.y):
+                        self._mark_dirty(
+                            self._ui, old_box, self._get_element_box(face_element)
+                        )
 
     def pause_pet(self):
         """Pause pet movement"""
@@ -624,87 +3023,165 @@ class Incognito(plugins.Plugin):
     def set_pet_speed(self, speed=1.0):
         """Set pet movement speed (1.0 = normal, 2.0 = double, 0.5 = half)"""
         self._set_pet_speed(speed)
-        self._logger.info("Pet speed set to %.1fx" % speed)
+        self._logger.info("Pet speed set to %.1fx", speed)
+
+    def set_motion_pattern(self, pattern):
+        """Switch the pet to another motion pattern (bounce, lissajous, wander, patrol)"""
+        if pattern not in MOTION_PATTERNS:
+            self._logger.warning(
+                "Unknown motion pattern '%s', choose from %s",
+                pattern,
+                ", ".join(sorted(MOTION_PATTERNS)),
+            )
+            return False
+        self._physics.set_pattern(pattern)
+        self._logger.info("Pet motion pattern set to %s", pattern)
+        self._check_pattern_obstacles()
+        return True
+
+    def reload_options(self, options):
+        """Validate new plugin options and apply the ones that changed, returns their names"""
+        self.options = dict(options)
+        changed = self._apply_config(parse_options(self.options, self._logger))
+        if changed:
+            self._logger.info("Reloaded options: %s", ", ".join(sorted(changed)))
+        return sorted(changed)
 
     def get_pet_info(self):
         """Get pet status information"""
+        pet = self._physics.state
+        timings = self._stats.snapshot()
+        move_calls = timings.get("_move_pet", {}).get("calls", 0)
         return {
-            "position": (self._pet_x, self._pet_y),
-            "velocity": (self._pet_velocity_x, self._pet_velocity_y),
-            "direction": (self._pet_direction_x, self._pet_direction_y),
+            "position": (pet.x, pet.y),
+            "velocity": (pet.velocity_x, pet.velocity_y),
+            "direction": (pet.direction_x, pet.direction_y),
             "screen_size": (self._screen_width, self._screen_height),
+            "bounds": pet.bounds,
             "movement_enabled": self._movement_enabled,
-            "move_interval": self._move_interval,
+            "move_interval": self._physics.timestep,
+            "speed": self._physics.speed,
+            "pattern": self._physics.pattern_name,
+            "extra_pets": self._swarm.positions() if self._swarm is not None else {},
+            "obstacles": (
+                len(self._physics.obstacles.boxes) if self._physics.obstacles else 0
+            ),
             "face_element": self._face_element,
-            "time_since_last_move": time.time() - self._last_move_time,
+            "config": self._config._asdict() if self._config is not None else None,
+            "idle": {
+                "state": self._idle.state(self._clock()),
+                "idle_seconds": self._idle.idle_time(self._clock()),
+            },
+            "dirty_rect": getattr(self._ui, DIRTY_RECT_ATTR, None),
+            "state_restored": self._state_restored,
+            "state_writes": self._state_store.writes if self._state_store else 0,
+            "sprites": dict(
+                _render_sprite.cache_info()._asdict(),
+                pasted=self._sprite_draw.pasted if self._sprite_draw else 0,
+                fallbacks=self._sprite_draw.fallbacks if self._sprite_draw else 0,
+            ),
+            "load_times_ms": {
+                name: None if seconds is None else round(seconds * 1000, 3)
+                for name, seconds in self._load_times.items()
+            },
+            "time_since_last_move": self._clock() - pet.time,
+            "display_profile": self._display_profile._asdict(),
+            "position_writes": self._position_writes,
+            "refreshes_avoided": self._writes_avoided,
+            "frames_deferred": self._pacer.deferred,
+            "refreshes_last_minute": self._pacer.refreshes_last_minute(self._clock()),
+            "hook_events": self._dispatcher.stats(),
+            "moves": {
+                "applied": self._position_writes,
+                "skipped": max(0, move_calls - self._position_writes),
+            },
+            "timings": timings,
         }
 
+    def on_webhook(self, path, request):
+        """Serve get_pet_info() as JSON for monitoring, or wake the pet on /wake.
+
+        Monitoring scrapes of the stats routes do not count as activity, so
+        they never keep the pet out of idle mode.
+        """
+        path = (path or "").strip("/")
+        if path == "wake":
+            self._wake_pet("web request")
+        elif path not in ("", "stats", "info"):
+            try:
+                from flask import abort
+
+                abort(404)
+            except ImportError:
+                return None
+
+        body = json.dumps(self.get_pet_info())
+        try:
+            from flask import Response
+
+            return Response(body, mimetype="application/json")
+        except ImportError:
+            return body
+
+    def get_hook_stats(self):
+        """Get counters of hook events that moved the pet, or were merged or dropped"""
+        return self._dispatcher.stats()
+
     def force_pet_move(self):
         """Force the pet to move immediately (for testing)"""
         if self._ui and self._enabled:
-            self._last_move_time = 0
-            self._move_pet(self._ui)
+            self._move_pet(self._ui, force=True)
             self._logger.info("Forced pet movement")
             return True
         return False
 
-    def _force_move_pet_now(self, ui):
-        """Immediately move pet without any timing checks using smooth movement"""
+    def start_trace(self, path):
+        """Record every hook call with its timestamp to a binary trace file"""
+        self.stop_trace()
         try:
-            if not self._movement_enabled:
-                self._logger.info("FORCE: Movement disabled - enabling it")
-                self._movement_enabled = True
-
-            if not self._face_element:
-                self._logger.error("FORCE: No face element found")
-                return False
-
-            if self._face_element not in ui._state._state:
-                self._logger.error(
-                    "FORCE: Face element '%s' not in UI state" % self._face_element
-                )
-                return False
-
-            face_element = ui._state._state[self._face_element]
-
-            old_x, old_y = self._pet_x, self._pet_y
+            self._recorder = _TraceRecorder(path, self._clock)
+            self._logger.info("Recording hook trace to %s", path)
+            return True
+        except Exception as err:
+            self._logger.warning("Cannot record trace to %s: %s", path, repr(err))
+            return False
 
-            next_x = self._pet_x + (self._pet_velocity_x * self._pet_direction_x)
-            next_y = self._pet_y + (self._pet_velocity_y * self._pet_direction_y)
+    def stop_trace(self):
+        """Stop recording the hook trace"""
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.close()
+            self._logger.info(
+                "Recorded %d hook events to %s", recorder.events, recorder.path
+            )
 
-            margin = self._pet_size
+    def replay_trace(self, path, ui):
+        """Replay a recorded trace faster than real time, in a fresh plugin set up on ``ui``.
 
-            if next_x <= margin:
-                next_x = margin
-                self._pet_direction_x = 1
-            elif next_x >= (self._screen_width - margin):
-                next_x = self._screen_width - margin
-                self._pet_direction_x = -1
-
-            if next_y <= margin:
-                next_y = margin
-                self._pet_direction_y = 1
-            elif next_y >= (self._screen_height - margin):
-                next_y = self._screen_height - margin
-                self._pet_direction_y = -1
-
-            self._pet_x = next_x
-            self._pet_y = next_y
-
-            if hasattr(face_element, "xy"):
-                face_element.xy = (int(self._pet_x), int(self._pet_y))
-                self._logger.info(
-                    "FORCE MOVED: Pet from (%.1f,%.1f) to (%.1f,%.1f)"
-                    % (old_x, old_y, self._pet_x, self._pet_y)
-                )
-                return True
-            else:
-                self._logger.error("FORCE: Face element has no 'xy' attribute!")
-                return False
+        ``ui`` should be a view of its own, such as the bench's stand-in view.
+        The replay never touches this plugin's state, clocks, stats or UI.
+        """
+        replica = type(self)()
+        replica.options = dict(
+            self.options, state_file="", config_file="", trace_file=None
+        )
+        replica.on_loaded()
+        replica.on_ui_setup(ui)
+        try:
+            result = _TraceReplayer(replica, ui).run(path)
+            result["pet_position"] = replica.get_pet_position()
+        finally:
+            replica.on_unload(ui)
+            replica.on_unloaded()
 
-        except Exception as err:
-            self._logger.error("FORCE MOVE failed: %s" % repr(err))
-            return False
+        self._logger.info(
+            "Replayed %d events (%.1fs of activity) in %.2fs, %.2fs CPU",
+            result["events"],
+            result["trace_seconds"],
+            result["wall_seconds"],
+            result["cpu_seconds"],
+        )
+        return result
 
     def test_pet_movement(self):
         """Test pet movement by moving it 10 times quickly"""
@@ -715,11 +3192,18 @@ class Incognito(plugins.Plugin):
         self._logger.info("Starting pet movement test...")
 
         for i in range(10):
-            result = self._force_move_pet_now(self._ui)
+            result = self._move_pet(self._ui, force=True)
+            pet = self._physics.state
             self._logger.info(
-                "Test move %d: success=%s, pet at (%d, %d)"
-                % (i + 1, result, self._pet_x, self._pet_y)
+                "Test move %d: success=%s, pet at (%d, %d)",
+                i + 1,
+                result,
+                pet.x,
+                pet.y,
             )
 
         self._logger.info("Pet movement test completed")
         return True
+
+
+_import_time = time.perf_counter() - _import_started